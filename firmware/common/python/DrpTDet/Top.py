@@ -9,15 +9,115 @@
 ## the terms contained in the LICENSE.txt file.
 ##############################################################################
 
+import logging
+import threading
 import time
-import struct
+
+import numpy as np
 
 import rogue
 import rogue.hardware.axi
 
 import pyrogue as pr
+import l2si_drp
 import surf.axi                     as axi
 
+def decodeRTT(words):
+    # rttBlock words (..., 4 lanes) -> fullToTrig, nfullToTrig (..., 4)
+    w = np.asarray(words, dtype=np.uint32)
+    return ( w & 0xffff, (w >> 16) & 0xfff )
+
+class RttMonitor(object):
+    # Samples TDetSemi.rttBlock every period in a background thread and keeps
+    # the last depth samples of every lane.  thresholds: {'fullToTrig':max,
+    # 'nfullToTrig':max}; a lane crossing a threshold is logged and passed to
+    # onAlarm(name, lane, value) once, and again only after it recovers.
+    FIELDS = ('fullToTrig', 'nfullToTrig')
+
+    def __init__(self, tdetSemi, period=0.1, depth=4096, thresholds=None, onAlarm=None):
+        self._dev       = tdetSemi
+        self.period     = period
+        self.thresholds = dict(thresholds or {})
+        self.onAlarm    = onAlarm
+        self._lock      = threading.Lock()
+        self._samples   = np.zeros((depth, 2, 4), dtype=np.uint16)
+        self._times     = np.full(depth, -np.inf)
+        self._head      = 0
+        self._count     = 0
+        self._active    = np.zeros((2, 4), dtype=bool)
+        self.alarms     = np.zeros((2, 4), dtype=np.uint64)
+        self._thread    = None
+        self._stopped   = threading.Event()
+        self._log       = logging.getLogger(__name__)
+
+    def sample(self):
+        s = np.stack(decodeRTT(self._dev.readRTT())).astype(np.uint16)
+        with self._lock:
+            self._samples[self._head] = s
+            self._times  [self._head] = time.monotonic()
+            self._head   = (self._head+1) % len(self._times)
+            self._count += 1
+        self._checkAlarms(s)
+        return s
+
+    def _checkAlarms(self, s):
+        limit = np.array([[self.thresholds.get(f, np.inf)]*4 for f in self.FIELDS])
+        over  = s > limit
+        with self._lock:
+            new = over & ~self._active
+            self.alarms  += new
+            self._active  = over
+        for i,lane in zip(*np.nonzero(new)):
+            name = self.FIELDS[i]
+            self._log.warning(f'RTT {name} lane {lane}: {s[i,lane]} > {limit[i,lane]:g}')
+            if self.onAlarm is not None:
+                self.onAlarm(name, int(lane), int(s[i,lane]))
+
+    def samples(self, seconds=None):
+        # (times, samples[n, field, lane]) in time order, optionally the last seconds
+        with self._lock:
+            n   = min(self._count, len(self._times))
+            idx = (self._head - n + np.arange(n)) % len(self._times)
+            t, s = self._times[idx], self._samples[idx]
+        if seconds is not None:
+            keep = t >= time.monotonic()-seconds
+            t, s = t[keep], s[keep]
+        return t, s
+
+    def stats(self, seconds=None, percentiles=(50, 90, 99)):
+        # {field:{'min','mean','max',p:...}} with one value per lane
+        t, s = self.samples(seconds)
+        if len(t) == 0:
+            return None
+        pct = np.percentile(s, percentiles, axis=0)
+        out = {}
+        for i,f in enumerate(self.FIELDS):
+            out[f] = { 'n'    : len(t),
+                       'min'  : s[:,i].min(axis=0),
+                       'mean' : s[:,i].mean(axis=0),
+                       'max'  : s[:,i].max(axis=0),
+                       **{p:pct[j,i] for j,p in enumerate(percentiles)} }
+        return out
+
+    def _run(self):
+        while not self._stopped.wait(self.period):
+            try:
+                self.sample()
+            except Exception as e:
+                self._log.warning(f'RTT sample failed: {e}')
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
 class TDetSemi(pr.Device):
     def __init__(self,
                  name        = 'TDetSemi',
@@ -36,18 +136,13 @@ class TDetSemi(pr.Device):
             mode      = 'RO'
         ))
 
-    def getRTT(self):
-        v = self.rttBlock.get()
-
-        def fullToTrig(lane,v=v):
-            return (v>>(32*lane))&0xffff
-        def nfullToTrig(lane,v=v):
-            return (v>>(32*lane+16))&0xfff
+    def readRTT(self):
+        # rttBlock words in one transaction
+        return np.asarray(self._rawRead(offset=self.rttBlock.offset, numWords=4), dtype=np.uint32)
 
-        return ( (fullToTrig(0),nfullToTrig(0)),
-                 (fullToTrig(1),nfullToTrig(1)),
-                 (fullToTrig(2),nfullToTrig(2)),
-                 (fullToTrig(3),nfullToTrig(3)) )
+    def getRTT(self):
+        full, nfull = decodeRTT(self.readRTT())
+        return tuple((int(f),int(n)) for f,n in zip(full,nfull))
 
 class TDetTiming(pr.Device):
     def __init__(self,
@@ -74,7 +169,21 @@ class TDetTiming(pr.Device):
             mode      = 'RO'
         ))
 
+        self._clkRates = None
+
+    def addClkRates(self, mon):
+        # mon is an l2si_drp.ClkRateMonitor sampling in the background
+        self._clkRates = mon
+        mon.addCounter(self.txRefClk)
+        mon.addCounter(self.rxRefClk)
+
     def getClkRates(self):
+        if self._clkRates is not None:
+            tx, txerr = self._clkRates.rate(self.txRefClk)
+            rx, rxerr = self._clkRates.rate(self.rxRefClk)
+            if tx is not None and rx is not None:
+                return ( tx, rx )
+
         rxp = self.rxRefClk.get()
         txp = self.txRefClk.get()
         time.sleep(1)
@@ -153,34 +262,29 @@ class QSFPMonitor(pr.Device):
         r = '{:c}{:c}/{:c}{:c}/20{:c}{:c}'.format(toChar(2),toChar(3),toChar(4),toChar(5),toChar(0),toChar(1))
         return r
 
+    @staticmethod
+    def _u16(block, words):
+        # One byte per 32-bit word, big-endian 16-bit quantities
+        b = np.frombuffer(block.to_bytes(4*words,'little'), dtype='<u4').reshape(-1,2) & 0xff
+        return (b[:,0]<<8) | b[:,1]
+
     def getRxPwr(self):  #mW
         #self.page.set(0)
-        v = self.RxPwrBlock.get()
-
-        def word(a,o):
-            return (a >> (32*o))&0xff
-        def tou16(a,o):
-            return struct.unpack('H',struct.pack('BB',word(a,o+1),word(a,o)))[0]
-        def pwr(lane,v=v):
-            p = tou16(v,2*lane)
-            return p * 0.0001
-                
-        return (pwr(0),pwr(1),pwr(2),pwr(3))
-
+        return tuple(self._u16(self.RxPwrBlock.get(),8) * 0.0001)
 
     def getTxBiasI(self):  #mA
         #self.page.set(0)
-        v = self.TxBiasBlock.get()
-
-        def word(a,o):
-            return (a >> (32*o))&0xff
-        def tou16(a,o):
-            return struct.unpack('H',struct.pack('BB',word(a,o+1),word(a,o)))[0]
-        def pwr(lane,v=v):
-            p = tou16(v,2*lane)
-            return p * 0.002
-                
-        return (pwr(0),pwr(1),pwr(2),pwr(3))
+        return tuple(self._u16(self.TxBiasBlock.get(),8) * 0.002)
+
+    def getDiagnostics(self):
+        # Temperature [C], Vcc [V], RX power [mW] and TX bias [mA]; the
+        # caller selects the module on the I2C mux
+        self.page.set(0)
+        tv = self._u16(self.TmpVccBlock.get(),6)
+        return ( tv[0].astype(np.int16)/256.,
+                 tv[2]*1.e-4,
+                 self._u16(self.RxPwrBlock .get(),8)*0.0001,
+                 self._u16(self.TxBiasBlock.get(),8)*0.002 )
 
 class I2cBus(pr.Device):
     def __init__(self,
@@ -211,6 +315,8 @@ class I2cBus(pr.Device):
             offset = 0x800
         ))
 
+        self._lock = threading.RLock()
+
     def selectDevice(self, device):
         idev = 0
         if 'QSFP0' in device:
@@ -219,14 +325,46 @@ class I2cBus(pr.Device):
             idev |= (1<<1)
         if 'SI570' in device:
             idev |= (1<<2)
-        self.select.set(idev)
+        # Always written: select may have been changed outside this class
+        with self._lock:
+            self.select.set(idev)
+
+    def run(self, device, func):
+        # Serialized access with the mux held on device
+        with self._lock:
+            self.selectDevice(device)
+            return func()
+
+    def runGrouped(self, requests):
+        # requests: list of (device, func).  Runs them grouped by device so
+        # the mux is switched once per device; results keep request order.
+        results = [None]*len(requests)
+        with self._lock:
+            order = sorted(range(len(requests)), key=lambda i: requests[i][0])
+            for n,i in enumerate(order):
+                device, func = requests[i]
+                if n == 0 or device != requests[order[n-1]][0]:
+                    self.selectDevice(device)
+                results[i] = func()
+        return results
+
+    def getDiagnostics(self):
+        # Both modules, one mux and page select each.  Returns arrays
+        # indexed by module: temperature [C], Vcc [V], rxPwr/txBias [module,lane]
+        diag = self.runGrouped([(name, self.node(name).getDiagnostics) for name in ('QSFP0','QSFP1')])
+        return { 'temperature' : np.array([d[0] for d in diag]),
+                 'vcc'         : np.array([d[1] for d in diag]),
+                 'rxPwr'       : np.stack([d[2] for d in diag]),
+                 'txBias'      : np.stack([d[3] for d in diag]) }
 
 class Top(pr.Device):
 
     def __init__(   self,       
-            name        = "KCU",
-            description = "Container for KCU",
-            memBase     = 0,
+            name          = "KCU",
+            description   = "Container for KCU",
+            memBase       = 0,
+            rttPeriod     = None,   # RttMonitor sample period (s), None = off
+            rttThresholds = None,
             **kwargs):
         super().__init__(name=name, description=description, **kwargs)
         
@@ -248,3 +386,26 @@ class Top(pr.Device):
             expand  = False,
         ))
 
+        # Background reference clock rates, sampled while the root polls
+        # (PollEn can be turned on at any time)
+        self.clkRates  = l2si_drp.ClkRateMonitor()
+        self._pollGate = l2si_drp.PollGate(self.clkRates)
+        self.TDetTiming.addClkRates(self.clkRates)
+
+        # Trigger round trip monitor, running while the root is started
+        self.rttMonitor = None
+        if rttPeriod is not None:
+            self.rttMonitor = RttMonitor(self.TDetSemi, period=rttPeriod, thresholds=rttThresholds)
+
+    def _start(self):
+        super()._start()
+        self._pollGate.start(self.root)
+        if self.rttMonitor is not None:
+            self.rttMonitor.start()
+
+    def _stop(self):
+        if self.rttMonitor is not None:
+            self.rttMonitor.stop()
+        self._pollGate.stop()
+        super()._stop()
+
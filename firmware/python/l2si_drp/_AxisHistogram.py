@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+#
+#  Software side of AxisHistogram.vhd.  A frame carries each histogram of a
+#  chain as a 0xBDBDBD<ADDR_WIDTH> header followed by 2**ADDR_WIDTH 32-bit
+#  bins, and ends with 0xBDBDBD00.  Bins are free running counts that wrap
+#  at 2**32 (ROLLOVER_EN_G) or saturate at 0xffffffff.
+#
+
+import logging
+import threading
+import time
+
+import numpy as np
+import rogue.interfaces.stream as ris
+
+HIST_MARKER_MASK = 0xffffff00
+HIST_MARKER      = 0xbdbdbd00
+HIST_SATURATED   = 0xffffffff
+
+def decodeHistogramFrame(words):
+    # [bins] per histogram in the chain, as views into words
+    words = np.asarray(words, dtype=np.uint32)
+    hists = []
+    pos   = 0
+    while pos < len(words):
+        hdr = int(words[pos])
+        if hdr & HIST_MARKER_MASK != HIST_MARKER:
+            raise ValueError(f'Bad histogram header {hdr:#x} at word {pos}')
+        aw = hdr & 0xff
+        if aw == 0:
+            return hists
+        n = 1<<aw
+        if pos+1+n > len(words):
+            raise ValueError('Truncated histogram frame')
+        hists.append(words[pos+1:pos+1+n])
+        pos += 1+n
+    raise ValueError('Histogram frame without end marker')
+
+def histogramSummary(counts, percentiles=(10, 50, 90, 99)):
+    # counts: (..., bins).  Mean bin, percentile bins, total and the count
+    # in the top (overflow) bin for each histogram
+    c     = np.asarray(counts, dtype=np.float64)
+    bins  = np.arange(c.shape[-1])
+    total = c.sum(axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = (c*bins).sum(axis=-1)/total
+    cdf   = np.cumsum(c, axis=-1)
+    q     = np.asarray(percentiles, dtype=np.float64)/100.
+    pct   = (cdf[..., None, :] < (q[:, None]*total[..., None, None])).sum(axis=-1)
+    return {
+        'total'       : total,
+        'mean'        : mean,
+        'percentiles' : dict(zip(percentiles, np.moveaxis(pct, -1, 0))),
+        'overflow'    : c[..., -1],
+    }
+
+class HistogramAccumulator(object):
+    # Unwraps successive cumulative snapshots into per-frame increments,
+    # keeps a 64-bit running total and the last depth increments so sums
+    # over a time window can be formed without re-reading anything.
+    # saturated (bins stuck at 0xffffffff) is only tracked when the firmware
+    # saturates (rollover=False); with rollover that value is an ordinary count.
+    def __init__(self, depth=1024, rollover=True):
+        self._depth  = depth
+        self._rollover = rollover
+        self._lock   = threading.Lock()
+        self._last   = None
+        self._totals = None
+        self._deltas = None
+        self._times  = np.full(depth, -np.inf)
+        self._head   = 0
+        self.frames     = 0
+        self.saturated  = None
+
+    def add(self, hists, t=None):
+        t   = time.monotonic() if t is None else t
+        cur = np.stack(hists)
+        with self._lock:
+            if self._last is None or self._last.shape != cur.shape:
+                self._last   = cur.copy()
+                self._totals = np.zeros(cur.shape, dtype=np.uint64)
+                self._deltas = np.zeros((self._depth,)+cur.shape, dtype=np.uint32)
+                self._times[:] = -np.inf
+                self._saturation(cur)
+                return None
+            d = cur - self._last                 # modulo 2**32
+            self._last[...]  = cur
+            self._totals    += d
+            self._deltas[self._head] = d
+            self._times [self._head] = t
+            self._head  = (self._head+1) % self._depth
+            self.frames += 1
+            self._saturation(cur)
+            return d
+
+    def _saturation(self, cur):
+        if not self._rollover:
+            self.saturated = cur == HIST_SATURATED
+
+    def totals(self):
+        with self._lock:
+            return None if self._totals is None else self._totals.copy()
+
+    def window(self, seconds=None, frames=None):
+        # Sum of the increments over the last seconds (or frames)
+        with self._lock:
+            if self._deltas is None:
+                return None
+            if frames is not None:
+                idx = (self._head - 1 - np.arange(min(frames, self._depth))) % self._depth
+                sel = idx[np.isfinite(self._times[idx])]
+            else:
+                sel = np.nonzero(self._times >= time.monotonic()-seconds)[0]
+            return self._deltas[sel].sum(axis=0, dtype=np.uint64)
+
+    def summary(self, seconds=None, frames=None, percentiles=(10, 50, 90, 99)):
+        c = self.totals() if seconds is None and frames is None else self.window(seconds, frames)
+        return None if c is None else histogramSummary(c, percentiles)
+
+class AxisHistogramReceiver(ris.Slave):
+    # Stream slave for the histogram DMA destination (the monitor lane after
+    # the data lanes of MigToPcieDma/MigIlvToPcieDma).  Each frame is copied
+    # out once and decoded without per-bin Python work.
+    def __init__(self, depth=1024, rollover=True):
+        ris.Slave.__init__(self)
+        self.accumulator = HistogramAccumulator(depth, rollover)
+        self.errors      = 0
+        self._log        = logging.getLogger(__name__)
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            if frame.getError():
+                self.errors += 1
+                return
+            data = frame.getNumpy(0, frame.getPayload())
+        try:
+            self.accumulator.add(decodeHistogramFrame(data.view('<u4')))
+        except ValueError as e:
+            self.errors += 1
+            self._log.warning(f'Histogram frame dropped: {e}')
+
+    def summary(self, seconds=None, frames=None, percentiles=(10, 50, 90, 99)):
+        return self.accumulator.summary(seconds, frames, percentiles)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+class ClkRateMonitor(object):
+    # Samples clock counters in the background and fits their rates over a
+    # sliding window, so rate() returns a cached value (MHz) immediately.
+    def __init__(self, period=0.25, window=32):
+        self.period   = period
+        self._window  = window
+        self._lock    = threading.Lock()
+        self._sources = collections.OrderedDict()
+        self._thread  = None
+        self._stopped = threading.Event()
+        self._log     = logging.getLogger(__name__)
+
+    def addCounter(self, variable, scale=16.e-6, bits=32, name=None):
+        # Free running counter; rate = scale * counts/s.  The timing counters
+        # tick once per 16 clocks, hence the default scale.
+        self._add(name or variable.path, variable, scale, bits)
+
+    def addRate(self, variable, scale=1.e-6, name=None):
+        # Register already holding a frequency in Hz; the window is averaged
+        self._add(name or variable.path, variable, scale, None)
+
+    def _add(self, name, variable, scale, bits):
+        with self._lock:
+            self._sources[name] = {
+                'variable' : variable,
+                'scale'    : scale,
+                'bits'     : bits,
+                'last'     : None,
+                'total'    : 0,
+                'history'  : collections.deque(maxlen=self._window),
+            }
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.period):
+            try:
+                self.sample()
+            except Exception as e:
+                self._log.warning(f'Clock rate sample failed: {e}')
+
+    def sample(self):
+        for src in list(self._sources.values()):
+            tb = time.perf_counter()
+            v  = src['variable'].get()
+            te = time.perf_counter()
+            with self._lock:
+                if src['bits'] is None:
+                    src['history'].append((te, v))
+                    continue
+                # Unwrap the counter into a running total
+                if src['last'] is not None:
+                    src['total'] += (v - src['last']) % (1<<src['bits'])
+                src['last'] = v
+                src['history'].append((0.5*(tb+te), src['total']))
+
+    def rate(self, name):
+        # (rate MHz, standard error MHz) or (None, None) until enough samples
+        if not isinstance(name, str):
+            name = name.path
+        with self._lock:
+            src  = self._sources[name]
+            hist = np.array(src['history'], dtype=np.float64)
+        if len(hist) < 3:
+            return (None, None)
+
+        if src['bits'] is None:
+            v = hist[:,1]*src['scale']
+            return (v.mean(), v.std(ddof=1)/np.sqrt(len(v)))
+
+        t   = hist[:,0]-hist[0,0]
+        c   = hist[:,1]-hist[0,1]
+        dt  = t-t.mean()
+        k   = (dt*(c-c.mean())).sum()/(dt*dt).sum()
+        res = c - c.mean() - k*dt
+        err = np.sqrt((res*res).sum()/(len(t)-2)/(dt*dt).sum())
+        return (k*src['scale'], err*src['scale'])
+
+    def rates(self):
+        return {name:self.rate(name) for name in list(self._sources)}
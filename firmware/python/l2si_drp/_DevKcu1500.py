@@ -22,52 +22,64 @@ class DevKcu1500(pr.Device):
                  tdet     = True,
                  gpu      = False,
                  pgp3     = False,
+                 devices  = None,   # subtrees to build, None builds all
                  **kwargs):
         super().__init__(**kwargs)
 
-        self.add(pcie.AxiPcieCore(
-            offset      = 0x0000_0000,
-            numDmaLanes = numDmaLanes,
-            expand      = False,
-        ))
+        # Subtrees left out are never constructed; short-lived tools that
+        # touch a few registers only pay for what they name here.
+        def build(name):
+            return devices is None or name in devices
 
-        if tdet:
-            self.add(drp.MigToPcieDma(
-                name     = 'MigToPcieDma',
-                offset    = 0x0080_0000,
-                numLanes  = numDmaLanes,
-                expand    = False,
+        if build('AxiPcieCore'):
+            self.add(pcie.AxiPcieCore(
+                offset      = 0x0000_0000,
+                numDmaLanes = numDmaLanes,
+                expand      = False,
             ))
 
-            self.add(drp.TDetSemi(
-                name     = 'TDetSemi',
-                offset    = 0x00A0_0000,
-                numLanes  = int(numTimingLanes/2),
-                expand    = False,
-            ))
+        if tdet:
+            if build('MigToPcieDma'):
+                self.add(drp.MigToPcieDma(
+                    name     = 'MigToPcieDma',
+                    offset    = 0x0080_0000,
+                    numLanes  = numDmaLanes,
+                    expand    = False,
+                ))
 
-            self.add(drp.TDetTiming(
-                name     = 'TDetTiming',
-                offset    = 0x00C0_0000,
-                numLanes  = numTimingLanes,
-                expand    = False,
-            ))
+            if build('TDetSemi'):
+                self.add(drp.TDetSemi(
+                    name     = 'TDetSemi',
+                    offset    = 0x00A0_0000,
+                    numLanes  = int(numTimingLanes/2),
+                    expand    = False,
+                ))
+
+            if build('TDetTiming'):
+                self.add(drp.TDetTiming(
+                    name     = 'TDetTiming',
+                    offset    = 0x00C0_0000,
+                    numLanes  = numTimingLanes,
+                    expand    = False,
+                ))
 
         elif numPgpLanes:
-            self.add(drp.MigIlvToPcieDma(
-                name     = 'MigIlvToPcieDma',
-                offset    = 0x0080_0000,
-                numLanes  = numDmaLanes,
-                expand    = False,
-            ))
+            if build('MigIlvToPcieDma'):
+                self.add(drp.MigIlvToPcieDma(
+                    name     = 'MigIlvToPcieDma',
+                    offset    = 0x0080_0000,
+                    numLanes  = numDmaLanes,
+                    expand    = False,
+                ))
 
             for i in range(numPgpLanes):
-                self.add(pgp.Pgp3AxiL(
-                    name    = f'Pgp3AxiL[{i}]',
-                    offset  = 0x00A0_8000 + i*0x10000,
-                    numVc   = 1,
-                    writeEn = True,
-                ))
+                if build('Pgp3AxiL'):
+                    self.add(pgp.Pgp3AxiL(
+                        name    = f'Pgp3AxiL[{i}]',
+                        offset  = 0x00A0_8000 + i*0x10000,
+                        numVc   = 1,
+                        writeEn = True,
+                    ))
                 self.add(pr.RemoteVariable(
                     name        = f'RxLinkId[{i}]',
                     description = 'PGP LinkID Received',
@@ -110,15 +122,16 @@ class DevKcu1500(pr.Device):
             addReset('PgpTxReset',1)
             addReset('PgpRxReset',2)
 
-        if gpu:
+        if gpu and build('AxiGpuAsyncCore'):
             self.add(pcie.AxiGpuAsyncCore(
                 name     = 'AxiGpuAsyncCore',
                 offset    = 0x00D0_0000,
                 expand    = False,
             ))
 
-        self.add(drp.I2CBus(
-            name     = 'I2CBus',
-            offset    = 0x00E0_0000,
-            expand    = False,
-        ))
+        if build('I2CBus'):
+            self.add(drp.I2CBus(
+                name     = 'I2CBus',
+                offset    = 0x00E0_0000,
+                expand    = False,
+            ))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+#
+#  DMA receive path qualification.  With a non-zero lane length TDetSemi
+#  sends each L1Accept as the 3 beat event header, a pad beat and length
+#  payload words, the first of which is a free running 32-bit per-lane
+#  event count (TDetSemi.vhd SEND_S).  The host consumes the DMA lanes,
+#  checks the counts in bulk and reports throughput, latency and loss.
+#
+
+import threading
+import time
+
+import numpy as np
+
+import l2si_drp
+
+TDET_HEADER_BYTES = 32      # event header (3 beats) + pad beat
+TDET_COUNT_WORD   = TDET_HEADER_BYTES//4
+L1ACCEPT          = 12      # service field, header bits [59:56]
+
+# Default latency histogram bin edges (s)
+LATENCY_BINS = np.concatenate([[0.], np.logspace(-6, 0, 61)])
+
+def counterContinuity(counts, bits=32):
+    # Bulk check of a free running counter: lost values, repeats and steps
+    # backwards (a step of more than half the range)
+    counts = np.asarray(counts, dtype=np.int64)
+    d      = np.diff(counts) % (1<<bits)
+    fwd    = (d > 0) & (d < (1<<(bits-1)))
+    return {
+        'lost'      : int((d[fwd]-1).sum()),
+        'gaps'      : int((d[fwd] > 1).sum()),
+        'repeats'   : int((d == 0).sum()),
+        'backwards' : int((d >= (1<<(bits-1))).sum()),
+    }
+
+class LaneRecorder(object):
+    # DmaReceiver consumer keeping count, service, size and times of every
+    # frame in preallocated arrays (grown by doubling)
+    def __init__(self, lane, capacity=1<<16):
+        self.lane  = lane
+        self._lock = threading.Lock()
+        self._n    = 0
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        old = getattr(self, '_data', None)
+        self._data = np.zeros(capacity, dtype=[('count','<u4'), ('service','u1'), ('size','<u4'),
+                                               ('accepted','<f8'), ('consumed','<f8')])
+        if old is not None:
+            self._data[:self._n] = old[:self._n]
+
+    def __call__(self, f):
+        w = f.array(np.uint32, size=4*(TDET_COUNT_WORD+1)) if f.size >= 4*(TDET_COUNT_WORD+1) else None
+        with self._lock:
+            if self._n == len(self._data):
+                self._alloc(2*len(self._data))
+            r = self._data[self._n]
+            r['count']    = w[TDET_COUNT_WORD] if w is not None else 0
+            r['service']  = (w[1] >> 24) & 0xf if w is not None else 0xff
+            r['size']     = f.size
+            r['accepted'] = f.time
+            r['consumed'] = time.monotonic()
+            self._n += 1
+
+    def data(self):
+        with self._lock:
+            return self._data[:self._n].copy()
+
+def laneReport(data, c, duration, bins=LATENCY_BINS):
+    # c: DmaReceiver counters over the run
+    events  = data[data['service'] == L1ACCEPT]
+    latency = data['consumed'] - data['accepted']
+    arrival = np.diff(data['accepted'])
+    hist,_  = np.histogram(latency, bins=bins)
+    pct     = lambda a,q: float(np.percentile(a, q)) if len(a) else None
+    return {
+        'frames'          : int(c['frames']),
+        'events'          : len(events),
+        'bytes'           : int(c['bytes']),
+        'framesPerSec'    : c['frames']/duration,
+        'bytesPerSec'     : c['bytes']/duration,
+        'drops'           : int(c['drops']),
+        'errors'          : int(c['errors']),
+        **counterContinuity(events['count']),
+        'latencyBins'     : bins.tolist(),
+        'latencyHist'     : hist.tolist(),
+        'latencyP50'      : pct(latency, 50),
+        'latencyP99'      : pct(latency, 99),
+        'latencyMax'      : float(latency.max()) if len(latency) else None,
+        'interArrivalP50' : pct(arrival, 50),
+        'interArrivalP99' : pct(arrival, 99),
+    }
+
+class DmaQualification(object):
+    # Enables the TDetSemi lanes with a fixed payload length, consumes the
+    # matching DMA lanes (dest 0) for duration seconds and reports per lane.
+    # Frames arrive at the trigger rate set up on the XPM partition.  Only
+    # the lanes under test are touched; all lane words are restored after.
+    def __init__(self, dev, tdetSemi=None, lanes=(0,1,2,3), path='auto', maxBytes=256<<20,
+                 host='localhost', port=8000):
+        self.dev       = dev
+        self.tdetSemi  = tdetSemi
+        self.lanes     = list(lanes)
+        self.maxBytes  = maxBytes
+        self.path      = l2si_drp.selectMemPath(dev, path)
+        self._streams  = l2si_drp.openDmaStreams(dev, {lane:{0} for lane in self.lanes}, self.path, host, port)
+
+        # Connected once; runs swap the consumer and difference the counters
+        self._receivers = {lane:l2si_drp.DmaReceiver(lane, maxBytes=maxBytes) for lane in self.lanes}
+        for lane in self.lanes:
+            self._streams[lane][0] >> self._receivers[lane]
+
+    def run(self, duration=10., length=1024, bins=LATENCY_BINS):
+        recorders = {lane:LaneRecorder(lane) for lane in self.lanes}
+        start     = {}
+        for lane,rx in self._receivers.items():
+            start[lane] = rx.counters()
+            rx.setConsumer(recorders[lane])
+            rx.start()
+
+        saved = None
+        if self.tdetSemi is not None:
+            saved = self.tdetSemi.readLanes()
+            test  = lambda enable: [l2si_drp.tdetLaneWord(length, clear=not enable, enable=enable, reserved=w)
+                                    if i in self.lanes else w for i,w in enumerate(saved)]
+
+        t0 = time.monotonic()
+        try:
+            if saved is not None:
+                # Clear the lanes under test with the new length, then enable them
+                self.tdetSemi.writeLanes(test(False))
+                self.tdetSemi.writeLanes(test(True))
+                t0 = time.monotonic()
+            time.sleep(duration)
+        finally:
+            if saved is not None:
+                self.tdetSemi.writeLanes(saved)
+            elapsed = time.monotonic()-t0
+            # Let the consumers drain what was already queued
+            for rx in self._receivers.values():
+                while rx.backlog():
+                    time.sleep(1.e-3)
+                rx.stop()
+                rx.setConsumer(None)
+
+        report = {}
+        for lane,rx in self._receivers.items():
+            c = rx.counters()
+            c = {k:c[k]-start[lane][k] for k in ('frames','bytes','drops','errors')}
+            report[lane] = laneReport(recorders[lane].data(), c, elapsed, bins)
+        return report
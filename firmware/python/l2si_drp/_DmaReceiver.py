@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+import rogue.interfaces.stream as ris
+
+class DmaFrame(object):
+    # Received frame handed to a consumer.  The rogue frame (and its DMA
+    # buffer) is referenced while queued; array() makes the one copy of the
+    # payload (rogue's getNumpy), only when the consumer asks for it.
+    # Consumers should return promptly so buffers go back to the driver.
+    __slots__ = ('lane', 'frame', 'size', 'channel', 'error', 'time')
+
+    def __init__(self, lane, frame, size, channel, error):
+        self.lane    = lane
+        self.frame   = frame
+        self.size    = size
+        self.channel = channel
+        self.error   = error
+        self.time    = time.monotonic()
+
+    def array(self, dtype=np.uint8, size=None):
+        # size: leading bytes only (default the whole payload)
+        with self.frame.lock():
+            a = self.frame.getNumpy(0, self.size if size is None else min(size, self.size))
+        return a.view(dtype) if dtype != np.uint8 else a
+
+class DmaReceiver(ris.Slave):
+    # Receive stage for one DMA lane.  Frames are counted and queued (up to
+    # maxBytes of payload, then dropped and counted) for a worker thread that
+    # calls consumer(DmaFrame).  Without a consumer the stage is a null sink
+    # that only counts, for measuring the sustainable frame rate.
+    def __init__(self, lane, maxBytes=64<<20, consumer=None):
+        ris.Slave.__init__(self)
+        self.lane      = lane
+        self.maxBytes  = maxBytes
+        self._consumer = consumer
+        self._cond     = threading.Condition()
+        self._queue    = collections.deque()
+        self._queued   = 0
+        self._thread   = None
+        self._stopped  = False
+        self._log      = logging.getLogger(__name__)
+
+        self.frames    = 0
+        self.bytes     = 0
+        self.drops     = 0
+        self.errors    = 0
+        self.consumed  = 0
+        self._last     = (time.monotonic(), 0, 0)
+        self._rates    = (0., 0.)
+
+    def setConsumer(self, consumer):
+        with self._cond:
+            self._consumer = consumer
+
+    def _acceptFrame(self, frame):
+        with frame.lock():
+            size    = frame.getPayload()
+            channel = frame.getChannel()
+            error   = frame.getError()
+
+        with self._cond:
+            self.frames += 1
+            self.bytes  += size
+            if error:
+                self.errors += 1
+            if self._consumer is None:
+                return
+            if self._queued + size > self.maxBytes:
+                self.drops += 1
+                return
+            self._queue.append(DmaFrame(self.lane, frame, size, channel, error))
+            self._queued += size
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopped and not self._queue:
+                    self._cond.wait()
+                if self._stopped:
+                    break
+                f        = self._queue.popleft()
+                consumer = self._consumer
+                self._queued -= f.size
+            try:
+                if consumer is not None:
+                    consumer(f)
+                self.consumed += 1
+            except Exception as e:
+                self._log.warning(f'Lane {self.lane} consumer failed: {e}')
+
+    def start(self):
+        if self._thread is None:
+            self._stopped = False
+            self._thread  = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+            with self._cond:
+                self._queue.clear()
+                self._queued = 0
+
+    def backlog(self):
+        with self._cond:
+            return len(self._queue)
+
+    def rates(self, minInterval=0.5):
+        # (frames/s, bytes/s) since the previous call, at most every minInterval
+        now = time.monotonic()
+        with self._cond:
+            t, frames, nbytes = self._last
+            if now - t >= minInterval:
+                self._rates = ((self.frames-frames)/(now-t), (self.bytes-nbytes)/(now-t))
+                self._last  = (now, self.frames, self.bytes)
+            return self._rates
+
+    def counters(self):
+        with self._cond:
+            return {'frames':self.frames, 'bytes':self.bytes, 'drops':self.drops,
+                    'errors':self.errors, 'consumed':self.consumed, 'backlog':len(self._queue),
+                    'queuedBytes':self._queued}
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+#
+#  Decoder for the frames built by EventTimingMessage.vhd (toSlvFormatted):
+#  one 968-bit timing message per frame, one stream per detector, padded to
+#  a whole number of AXI stream beats.
+#
+
+import numpy as np
+
+EVENT_TIMING_BYTES = 121
+
+# Wire layout, byte offsets of toSlvFormatted()
+EVENT_TIMING_WIRE = np.dtype({
+    'names'   : ['pulseId', 'timeStamp', 'fixedRates', 'acRates', 'acTimeSlot', 'acTimeSlotPhase',
+                 'beamPresent', 'beamDestination', 'beamCharge', 'beamEnergy', 'photonWavelen',
+                 'control16', 'mpsLimit', 'mpsClass', 'control'],
+    'formats' : ['<u8', '<u8', ('u1',10), ('u1',6), 'u1', '<u2',
+                 'u1', 'u1', '<u2', ('<u2',4), ('<u2',2),
+                 '<u2', ('u1',16), ('u1',16), ('<u2',18)],
+    'offsets' : [0, 8, 16, 26, 32, 33,
+                 35, 36, 37, 39, 47,
+                 51, 53, 69, 85],
+    'itemsize': EVENT_TIMING_BYTES,
+})
+
+# Decoded record
+EVENT_TIMING_DTYPE = np.dtype([
+    ('detector',        'u1'),
+    ('pulseId',         '<u8'),
+    ('timeStamp',       '<u8'),
+    ('seconds',         '<u4'),
+    ('nanoseconds',     '<u4'),
+    ('fixedRates',      '<u2'),     # bit j = fixedRates(j)
+    ('acRates',         'u1'),      # bit j = acRates(j)
+    ('acTimeSlot',      'u1'),
+    ('acTimeSlotPhase', '<u2'),
+    ('beamPresent',     '?'),
+    ('beamDestination', 'u1'),
+    ('beamCharge',      '<u2'),
+    ('control',         '<u2', 18),
+])
+
+_FIXED_BITS = (1 << np.arange(10)).astype(np.uint16)
+_AC_BITS    = (1 << np.arange(6)).astype(np.uint8)
+
+def eventTimingBuffer(frames):
+    # (n, EVENT_TIMING_BYTES) uint8 from a 2-D array (rows are frames, beat
+    # padding allowed) or a sequence of bytes-like frames
+    if isinstance(frames, np.ndarray) and frames.ndim == 2:
+        buf = frames.view(np.uint8) if frames.dtype != np.uint8 else frames
+    else:
+        buf = np.empty((len(frames), EVENT_TIMING_BYTES), dtype=np.uint8)
+        for i,f in enumerate(frames):
+            a = np.frombuffer(f, dtype=np.uint8)
+            if len(a) < EVENT_TIMING_BYTES:
+                raise ValueError(f'Frame {i} is {len(a)} bytes, expected {EVENT_TIMING_BYTES}')
+            buf[i] = a[:EVENT_TIMING_BYTES]
+    if buf.shape[1] < EVENT_TIMING_BYTES:
+        raise ValueError(f'Frames are {buf.shape[1]} bytes, expected {EVENT_TIMING_BYTES}')
+    return np.ascontiguousarray(buf[:, :EVENT_TIMING_BYTES])
+
+def decodeEventTiming(frames, detectors=0):
+    # Structured array (EVENT_TIMING_DTYPE) for a batch of frames.
+    # detectors: detector index per frame (or one for all), e.g. the DMA dest
+    raw = eventTimingBuffer(frames).view(EVENT_TIMING_WIRE).reshape(-1)
+    rec = np.empty(len(raw), dtype=EVENT_TIMING_DTYPE)
+    rec['detector']        = detectors
+    rec['pulseId']         = raw['pulseId']
+    rec['timeStamp']       = raw['timeStamp']
+    rec['seconds']         = raw['timeStamp'] >> np.uint64(32)
+    rec['nanoseconds']     = raw['timeStamp'] & np.uint64(0xffffffff)
+    rec['fixedRates']      = (raw['fixedRates'] & 1) @ _FIXED_BITS
+    rec['acRates']         = (raw['acRates'] & 1) @ _AC_BITS
+    rec['acTimeSlot']      = raw['acTimeSlot']
+    rec['acTimeSlotPhase'] = raw['acTimeSlotPhase']
+    rec['beamPresent']     = raw['beamPresent'] & 1
+    rec['beamDestination'] = raw['beamDestination'] & 0xf
+    rec['beamCharge']      = raw['beamCharge']
+    rec['control']         = raw['control']
+    return rec
+
+def checkEventTiming(rec, step=None, last=None):
+    # Continuity of each detector's stream, in arrival order within the batch.
+    # step: expected pulse ID increment (None = only order is checked).
+    # last: {detector:(pulseId, timeStamp)} from the previous batch, updated.
+    # Returns {check:indices into rec} for duplicates, outOfOrder, gaps and
+    # timeReversal (pulse ID advancing while the timestamp goes back).
+    last  = {} if last is None else last
+    order = np.argsort(rec['detector'], kind='stable')
+    det   = rec['detector'][order]
+    pid   = rec['pulseId'][order].astype(np.int64)
+    ts    = rec['timeStamp'][order].astype(np.int64)
+
+    first     = np.ones(len(det), dtype=bool)
+    first[1:] = det[1:] != det[:-1]
+    prevPid   = np.empty_like(pid)
+    prevTs    = np.empty_like(ts)
+    prevPid[1:] = pid[:-1]
+    prevTs [1:] = ts [:-1]
+    known = ~first
+    for i in np.nonzero(first)[0]:
+        d = int(det[i])
+        if d in last:
+            prevPid[i], prevTs[i] = last[d]
+            known[i] = True
+
+    dp = pid - prevPid
+    dt = ts  - prevTs
+    checks = {
+        'duplicates'   : known & (dp == 0),
+        'outOfOrder'   : known & (dp <  0),
+        'timeReversal' : known & (dp >  0) & (dt < 0),
+    }
+    if step is not None:
+        checks['gaps'] = known & (dp > step)
+
+    lastIdx = np.nonzero(np.append(first[1:], True))[0]
+    for i in lastIdx:
+        last[int(det[i])] = (int(pid[i]), int(ts[i]))
+
+    return {k:np.sort(order[v]) for k,v in checks.items()}
+
+class EventTimingDecoder(object):
+    # Batch decoder keeping per-detector continuity across batches
+    def __init__(self, step=None):
+        self.step   = step
+        self.last   = {}
+        self.events = 0
+        self.errors = {'duplicates':0, 'outOfOrder':0, 'timeReversal':0, 'gaps':0}
+
+    def decode(self, frames, detectors=0):
+        rec    = decodeEventTiming(frames, detectors)
+        report = checkEventTiming(rec, self.step, self.last)
+        self.events += len(rec)
+        for k,v in report.items():
+            self.errors[k] += len(v)
+        return rec, report
+
+    def decodeDmaFrames(self, frames):
+        # DmaFrame batch (DmaReceiver consumer); the channel is the detector
+        return self.decode([f.array() for f in frames], np.array([f.channel for f in frames]))
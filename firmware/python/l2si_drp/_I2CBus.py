@@ -18,7 +18,46 @@ import l2si_drp
 import struct
 import time
 
+import numpy as np
+
+QsfpDiagDtype = np.dtype([
+    ('temperature', np.float64),        # C
+    ('vcc',         np.float64),        # V
+    ('rxPower',     np.float64, (4,)),  # mW
+    ('txBias',      np.float64, (4,)),  # mA
+])
+
+def decodeQsfpDiag(tmpVcc, rxTx):
+    # tmpVcc: registers 22-27, rxTx: registers 34-49, one byte per 32-bit word
+    # and big-endian 16-bit quantities (SFF-8636 lower page)
+    def u16(words):
+        b = np.asarray(words, dtype=np.uint32).reshape(-1,2) & 0xff
+        return (b[:,0]<<8) | b[:,1]
+
+    tv = u16(tmpVcc)
+    rt = u16(rxTx)
+    d  = np.zeros((), dtype=QsfpDiagDtype)
+    d['temperature'] = tv[0].astype(np.int16) / 256.
+    d['vcc']         = tv[2] * 1.e-4
+    d['rxPower']     = rt[0:4] * 1.e-4
+    d['txBias']      = rt[4:8] * 2.e-3
+    return d
+
+def i2cTarget(dev):
+    # (bus, select value) when dev sits behind an I2CBus mux, (bus, None)
+    # when its contents depend on a select the tree does not express (the
+    # shared QSFP window), None when dev is not behind the mux
+    while dev is not None and dev.parent is not None and dev.parent is not dev:
+        if isinstance(dev.parent, I2CBus):
+            return (dev.parent, dev.parent.muxTarget(dev))
+        dev = dev.parent
+    return None
+
 class I2CBus(pr.Device):
+
+    # Child devices that always sit on one mux target
+    muxDevices = {'Si570':'SI570'}
+
     def __init__(self,
                  name        = 'I2cBus',
                  description = 'Local bus',
@@ -29,20 +68,22 @@ class I2CBus(pr.Device):
             **kwargs
         )
 
+        selectEnum = {
+            0x00: 'None',
+            0x02: 'QSFP1',
+            0x04: 'SI570',
+            0x08: 'Fan',
+            0x10: 'QSFP0',
+            0x20: 'EEPROM',
+        }
+
         self.add(pr.RemoteVariable(
             name      = 'select',
             offset    = 0x0,
             bitSize   = 8,
             verify    = False,
             mode      = 'RW',
-            enum = {
-                0x00: 'None',
-                0x02: 'QSFP1',
-                0x04: 'SI570',
-                0x08: 'Fan',
-                0x10: 'QSFP0',
-                0x20: 'EEPROM',
-            }
+            enum      = selectEnum,
         ))
 
         self.add(Qsfp(
@@ -56,8 +97,63 @@ class I2CBus(pr.Device):
             offset = 0x800,
         ))
 
-    def programSi570(self, f):
-        
-        self.select.set(0x04)
+        # All mux-dependent accesses go through run()/submit(); select is
+        # written only by the scheduler
+        self._targets  = {v:k for k,v in selectEnum.items()}
+        self.scheduler = l2si_drp.I2cScheduler(self.select.set)
+
+    def _start(self):
+        super()._start()
+        self.scheduler.start()
+
+    def _stop(self):
+        self.scheduler.stop()
+        super()._stop()
 
-        self.Si570.set_freq(None,None,f)
+    def _childBlocks(self, op, kwargs):
+        # Each child on a fixed target with the mux held and every
+        # transaction checked before it moves.  The shared QSFP window has no
+        # target and is left to getQsfpDiagnostics.
+        for dev in self.devices.values():
+            target = self.muxTarget(dev)
+            if target is not None:
+                self.run(target, lambda dev=dev: (getattr(dev, op)(recurse=True, checkEach=True, **kwargs),
+                                                  dev.checkBlocks(recurse=True)))
+
+    def readBlocks(self, *, recurse=True, variable=None, checkEach=False, **kwargs):
+        super().readBlocks(recurse=False, variable=variable, checkEach=checkEach, **kwargs)
+        if recurse and variable is None:
+            self._childBlocks('readBlocks', kwargs)
+
+    def writeBlocks(self, *, recurse=True, variable=None, checkEach=False, **kwargs):
+        super().writeBlocks(recurse=False, variable=variable, checkEach=checkEach, **kwargs)
+        if recurse and variable is None:
+            self._childBlocks('writeBlocks', kwargs)
+
+    def verifyBlocks(self, *, recurse=True, variable=None, checkEach=False, **kwargs):
+        super().verifyBlocks(recurse=False, variable=variable, checkEach=checkEach, **kwargs)
+        if recurse and variable is None:
+            self._childBlocks('verifyBlocks', kwargs)
+
+    def muxTarget(self, dev):
+        return self._targets.get(self.muxDevices.get(dev.name))
+
+    def submit(self, target, func):
+        # target is a select value or its name ('QSFP0', 'SI570', ...)
+        return self.scheduler.submit(self._targets.get(target,target), func)
+
+    def run(self, target, func):
+        return self.scheduler.run(self._targets.get(target,target), func)
+
+    def getQsfpDiagnostics(self):
+        # One row per module (QSFP0, QSFP1): page 0, two reads
+        def diag():
+            self.QSFP._rawWrite(offset=127<<2, data=0)
+            return decodeQsfpDiag(self.QSFP._rawRead(offset=22<<2, numWords=6),
+                                  self.QSFP._rawRead(offset=34<<2, numWords=16))
+
+        futs = [self.submit(target, diag) for target in ('QSFP0','QSFP1')]
+        return np.array([f.result() for f in futs], dtype=QsfpDiagDtype)
+
+    def programSi570(self, f):
+        self.run('SI570', lambda: self.Si570.set_freq(None,None,f))
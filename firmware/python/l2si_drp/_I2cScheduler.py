@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'EPIX'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'EPIX', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import collections
+import concurrent.futures
+import contextlib
+import threading
+
+class I2cScheduler(object):
+    # Serializes accesses behind the I2C mux.  Requests are queued per mux
+    # target and a worker runs each target's queue as one group, so the
+    # select register is written once per group.  The scheduler owns the
+    # select register: it is always written under the lock on entry, never
+    # trusted from a cached value.
+    def __init__(self, select):
+        self._select   = select     # callable writing the mux select value
+        self._lock     = threading.RLock()
+        self._cond     = threading.Condition()
+        self._queues   = collections.OrderedDict()
+        self._owner    = None       # thread holding the mux
+        self._held     = None       # target it holds
+        self._thread   = None
+        self._stopped  = False
+        self.switches  = 0
+
+    def _switch(self, target):
+        self._select(target)
+        self.switches += 1
+
+    @contextlib.contextmanager
+    def selected(self, target):
+        # Synchronous access with the mux held on target.  A nested
+        # selection by the holder switches and restores the outer target.
+        with self._lock:
+            outer       = self._held
+            self._owner = threading.get_ident()
+            if outer != target:
+                self._switch(target)
+            self._held  = target
+            try:
+                yield
+            finally:
+                self._held = outer
+                if outer is None:
+                    self._owner = None
+                elif outer != target:
+                    self._switch(outer)
+
+    def submit(self, target, func):
+        # Without a worker (before start or after stop) the request runs
+        # inline and the returned future is already complete
+        fut = concurrent.futures.Future()
+        with self._cond:
+            if self._thread is not None and not self._stopped:
+                self._queues.setdefault(target, collections.deque()).append((func, fut))
+                self._cond.notify()
+                return fut
+        fut.set_running_or_notify_cancel()
+        try:
+            with self.selected(target):
+                fut.set_result(func())
+        except Exception as e:
+            fut.set_exception(e)
+        return fut
+
+    def run(self, target, func):
+        # Inline when no worker is running or when the caller already holds
+        # the mux (from within a request or a selected() block)
+        if self._thread is None or self._owner == threading.get_ident():
+            with self.selected(target):
+                return func()
+        return self.submit(target, func).result()
+
+    def _next(self):
+        # Oldest queue first; a drained target re-queues at the back
+        with self._cond:
+            while not self._stopped and not self._queues:
+                self._cond.wait()
+            if self._stopped:
+                return None, []
+            target = next(iter(self._queues))
+            return target, list(self._queues.pop(target))
+
+    def _run(self):
+        while True:
+            target, batch = self._next()
+            if target is None:
+                break
+            with self.selected(target):
+                for func, fut in batch:
+                    if not fut.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        fut.set_result(func())
+                    except Exception as e:
+                        fut.set_exception(e)
+
+    def start(self):
+        if self._thread is None:
+            self._stopped = False
+            self._thread  = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify()
+            self._thread.join()
+            self._thread = None
+            # Fail anything still queued
+            with self._cond:
+                for q in self._queues.values():
+                    for func, fut in q:
+                        fut.cancel()
+                self._queues.clear()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pyrogue as pr
+import axipcie
+import os
+import stat
+import time
+
+import rogue.hardware.axi
+
+# Register and DMA access either directly through the local driver
+# ('direct') or through the rogue TCP bridge at host:port ('bridge').
+
+def isLocalDevice(dev):
+    try:
+        return stat.S_ISCHR(os.stat(dev).st_mode)
+    except (OSError, TypeError):
+        return False
+
+def selectMemPath(dev, path='auto'):
+    if path == 'auto':
+        return 'direct' if isLocalDevice(dev) else 'bridge'
+    if path not in ('direct', 'bridge'):
+        raise ValueError(f'Unknown memory path {path}')
+    return path
+
+def openMemMap(dev, path, host='localhost', port=8000):
+    if path == 'direct':
+        return rogue.hardware.axi.AxiMemMap(dev)
+    return axipcie.createAxiPcieMemMap('sim', host, port)
+
+def openDmaStreams(dev, lanes, path, host='localhost', port=8000):
+    # {lane:{dest:stream}} for lanes = {lane:dests}, as createAxiPcieDmaStreams
+    if path == 'direct':
+        return {lane:{dest:rogue.hardware.axi.AxiStreamDma(dev, 0x100*lane+dest, True) for dest in dests}
+                for lane,dests in lanes.items()}
+    return axipcie.createAxiPcieDmaStreams('sim', lanes, host, port)
+
+def memProbe(memMap, name='MemProbe'):
+    # Bare device for raw accesses on a memory map outside any tree
+    return pr.Device(name=name, memBase=memMap)
+
+def memLatency(memMap, address=0x0002_0000, n=100):
+    # Median round trip (s) of single word reads, AxiVersion by default
+    probe = memProbe(memMap)
+    t = []
+    for i in range(n):
+        t0 = time.perf_counter()
+        probe._rawRead(offset=address)
+        t.append(time.perf_counter()-t0)
+    return sorted(t)[n//2]
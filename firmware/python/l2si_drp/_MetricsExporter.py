@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pyrogue as pr
+import l2si_drp
+import collections
+import http.server
+import logging
+import threading
+import time
+
+import numpy as np
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Pgp3AxiL status registers exported as link state
+PGP_LINK_STATUS = ('PhyActive', 'LocalLinkReady', 'RemLinkReady', 'LinkReady')
+
+def _value(v):
+    if isinstance(v, (float, np.floating)):
+        return repr(float(v))
+    return str(int(v))
+
+def _labels(labels):
+    esc = lambda v: str(v).replace('\\','\\\\').replace('"','\\"').replace('\n','\\n')
+    return ','.join(f'{k}="{esc(v)}"' for k,v in labels.items())
+
+class MetricsExporter(object):
+    # OpenMetrics text endpoint for card health.  A background thread takes
+    # one batched snapshot per period (the only place registers are read)
+    # and renders it; HTTP requests are answered from the rendered text.
+    def __init__(self, root, addr='127.0.0.1', port=0, period=5.0):
+        self._root    = root
+        self._addr    = addr
+        self._port    = port
+        self.period   = period
+        self._lock    = threading.Lock()
+        self._text    = '# EOF\n'
+        self._server  = None
+        self._threads = []
+        self._stopped = threading.Event()
+        self._log     = logging.getLogger(__name__)
+        self.address  = None
+
+    def _cards(self):
+        # PcieControl devices: one per card on a MultiCardRoot
+        if hasattr(self._root, 'cards'):
+            return self._root.cards
+        return [self._root.PcieControl]
+
+    def _clkRate(self, v):
+        mon = getattr(self._root, 'clkRates', None)
+        if mon is not None:
+            try:
+                rate, err = mon.rate(v)
+                if rate is not None:
+                    return rate
+            except KeyError:
+                pass
+        return None
+
+    def collect(self):
+        fams = collections.OrderedDict()
+        regs = []
+
+        def add(name, typ, help, labels, value):
+            fams.setdefault(name, (typ, help, []))[2].append((labels, value))
+
+        for card in self._cards():
+            dev  = card.DevKcu1500
+            base = {'card':card.devname}
+
+            for name in ('MigToPcieDma', 'MigIlvToPcieDma'):
+                if name not in dev.nodes:
+                    continue
+                dma = dev.node(name)
+                for lane,s in enumerate(dma.getStatus()):
+                    lbl = {**base, 'lane':lane}
+                    for field in ('BlocksFree', 'BlocksQueued', 'WriteQueCnt', 'WriteIndex', 'ReadIndex'):
+                        add(f'drp_mig_{field.lower()}', 'gauge', f'MigChannel {field}', lbl, int(s[field]))
+                t = dma.telemetry.latest()
+                if t is not None:
+                    for lane in range(len(t['inFlight'])):
+                        lbl = {**base, 'lane':lane}
+                        add('drp_mig_in_flight_blocks', 'gauge', 'Blocks written but not yet read', lbl, int(t['inFlight'][lane]))
+                        add('drp_mig_drain_bytes_per_second', 'gauge', 'Host DMA throughput', lbl, float(t['bytesPerSec'][lane]))
+                for ch in dma.devices.values():
+                    for v in ch.variables.values():
+                        if v.name.endswith('Total') and 'Oflow' in v.name:
+                            add('drp_mig_overflows', 'counter', 'MigChannel overflow counts (64-bit)',
+                                {**base, 'channel':ch.name, 'counter':v.name[:-5]}, v.value())
+                for v in dma.variables.values():
+                    if v.name.startswith('MonClkRate_'):
+                        rate = self._clkRate(v)
+                        if rate is None:
+                            regs.append(('drp_mon_clk_rate_hz', 'MonClkRate', {**base, 'clock':v.name[11:]}, v, 1.))
+                        else:
+                            add('drp_mon_clk_rate_hz', 'gauge', 'MonClkRate', {**base, 'clock':v.name[11:]}, rate*1.e6)
+
+            for name,d in dev.devices.items():
+                if name.startswith('Pgp3AxiL'):
+                    lane = name[name.index('[')+1:-1]
+                    for v in d.variableList:
+                        if v.name in PGP_LINK_STATUS:
+                            regs.append(('drp_pgp_link_status', 'Pgp3AxiL link state',
+                                         {**base, 'lane':lane, 'status':f'{v.parent.name}.{v.name}'}, v, None))
+            for name,v in dev.variables.items():
+                if name.startswith('RxLinkId['):
+                    regs.append(('drp_pgp_rx_link_id', 'PGP LinkID received',
+                                 {**base, 'lane':name[9:-1]}, v, None))
+
+            if 'TDetTiming' in dev.nodes:
+                for v in dev.TDetTiming.TimingFrameRx.variables.values():
+                    if v.mode == 'RO' and isinstance(v, pr.RemoteVariable):
+                        regs.append(('drp_timing_frame_rx', 'TimingFrameRx status',
+                                     {**base, 'register':v.name}, v, None))
+
+            if 'I2CBus' in dev.nodes:
+                try:
+                    diag = dev.I2CBus.getQsfpDiagnostics()
+                except Exception as e:
+                    self._log.warning(f'{card.devname}: QSFP diagnostics failed: {e}')
+                    diag = []
+                for module,q in enumerate(diag):
+                    lbl = {**base, 'module':module}
+                    add('drp_qsfp_temperature_celsius', 'gauge', 'QSFP temperature', lbl, float(q['temperature']))
+                    add('drp_qsfp_vcc_volts', 'gauge', 'QSFP supply', lbl, float(q['vcc']))
+                    for lane in range(4):
+                        add('drp_qsfp_rx_power_watts', 'gauge', 'QSFP receive power',
+                            {**lbl, 'lane':lane}, float(q['rxPower'][lane])*1.e-3)
+                        add('drp_qsfp_tx_bias_amperes', 'gauge', 'QSFP transmit bias',
+                            {**lbl, 'lane':lane}, float(q['txBias'][lane])*1.e-3)
+
+        # Remaining registers in one batch
+        l2si_drp.readVariables(self._root, [r[3] for r in regs])
+        for name,help,lbl,v,scale in regs:
+            value = v.value()
+            if isinstance(value, (bool, int, float, np.number, np.bool_)):
+                add(name, 'gauge', help, lbl, value*scale if scale else value)
+
+        lines = []
+        for name,(typ,help,samples) in fams.items():
+            lines.append(f'# TYPE {name} {typ}')
+            lines.append(f'# HELP {name} {help}')
+            sfx = '_total' if typ == 'counter' else ''
+            for lbl,value in samples:
+                lines.append(f'{name}{sfx}{{{_labels(lbl)}}} {_value(value)}')
+        lines.append('# TYPE drp_snapshot_timestamp_seconds gauge')
+        lines.append(f'drp_snapshot_timestamp_seconds {time.time():.3f}')
+        lines.append('# EOF')
+
+        with self._lock:
+            self._text = '\n'.join(lines) + '\n'
+
+    def text(self):
+        with self._lock:
+            return self._text
+
+    def _collectRun(self):
+        while True:
+            try:
+                self.collect()
+            except Exception as e:
+                self._log.warning(f'Metrics snapshot failed: {e}')
+            if self._stopped.wait(self.period):
+                break
+
+    def start(self):
+        if self._server is not None:
+            return
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = exporter.text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((self._addr, self._port), Handler)
+        self.address = f'http://{self._addr}:{self._server.server_address[1]}/metrics'
+        self._stopped.clear()
+        self._threads = [threading.Thread(target=self._server.serve_forever, daemon=True),
+                         threading.Thread(target=self._collectRun, daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._stopped.set()
+            self._server.shutdown()
+            self._server.server_close()
+            for t in self._threads:
+                t.join()
+            self._server  = None
+            self._threads = []
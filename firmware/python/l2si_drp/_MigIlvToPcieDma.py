@@ -9,6 +9,9 @@
 # contained in the LICENSE.txt file.
 #-----------------------------------------------------------------------------
 import pyrogue as pr
+import l2si_drp
+
+import time
 
 class MigChannel(pr.Device):
     def __init__(self,
@@ -22,6 +25,9 @@ class MigChannel(pr.Device):
             **kwargs
         )
 
+        self._blockSize   = blockSize
+        self._oflowLast   = None
+
         self.add(pr.RemoteVariable(
             name      = 'BlockSize',
             offset    = 0x00,
@@ -95,6 +101,59 @@ class MigChannel(pr.Device):
         oflow('hwIbOflow[2]',0x22)
         oflow('hwIbOflow[3]',0x23)
 
+        # The 8-bit counters above are extended to 64 bits in software from
+        # the parent's telemetry samples (every oflowPeriod seconds while the
+        # root polls); the period bounds the event rate (256 per period) that
+        # can be accumulated without ambiguity.
+        oflowNames = [('ibAxisOflowsTotal','ibAxisOflowsRate'),
+                      ('dmaOflowsTotal'   ,'dmaOflowsRate'   )] + \
+                     [(f'hwIbOflowTotal[{i}]',f'hwIbOflowRate[{i}]') for i in range(4)]
+
+        for total,rate in oflowNames:
+            self.add(pr.LocalVariable(
+                name      = total,
+                mode      = 'RO',
+                value     = 0,
+                typeStr   = 'UInt64',
+            ))
+            self.add(pr.LocalVariable(
+                name      = rate,
+                mode      = 'RO',
+                value     = 0.0,
+                units     = '1/s',
+                disp      = '{:.1f}',
+            ))
+
+        self._oflowTotal  = [0]*len(oflowNames)
+        self._oflowTotals = [self.node(total) for total,rate in oflowNames]
+        self._oflowRates  = [self.node(rate)  for total,rate in oflowNames]
+
+    def getStatus(self):
+        # Whole channel window in one transaction
+        return l2si_drp.decodeMigStatus(
+            self._rawRead(offset=0, numWords=l2si_drp.MIG_ILV_CHANNEL_WORDS),
+            blockSize    = self._blockSize,
+            channelWords = l2si_drp.MIG_ILV_CHANNEL_WORDS,
+            oflows       = True)[0]
+
+    def accumulateOflows(self, status=None, t=None):
+        # status: a getStatus() row, else ibAxisOflows/dmaOflows at 0x1c-0x1d
+        # and hwIbOflow[0..3] at 0x20-0x23 are read here
+        if status is None:
+            w = self._rawRead(offset=0x1c, numWords=2)
+            b = w[0].to_bytes(4,'little')[:2] + w[1].to_bytes(4,'little')
+        else:
+            b = [int(status['ibAxisOflows']), int(status['dmaOflows'])] + [int(v) for v in status['hwIbOflow']]
+        t = time.monotonic() if t is None else t
+        if self._oflowLast is not None:
+            dt = t - self._oflowLast[0]
+            for i,(v,last) in enumerate(zip(b,self._oflowLast[1])):
+                d = (v-last)&0xff
+                self._oflowTotal[i] += d
+                self._oflowTotals[i].set(self._oflowTotal[i])
+                self._oflowRates [i].set(d/dt)
+        self._oflowLast = (t,b)
+
 class MigIlvToPcieDma(pr.Device):
     def __init__(self,
                  name        = 'MigToPcieDma',
@@ -102,6 +161,7 @@ class MigIlvToPcieDma(pr.Device):
                  numLanes    = 1,
                  blockSize   = 21,
                  monClks     = 4,
+                 oflowPeriod = 0.1,
                  **kwargs):
         super().__init__(
             name        = name,
@@ -109,6 +169,8 @@ class MigIlvToPcieDma(pr.Device):
             **kwargs
         )
 
+        self._blockSize = blockSize
+
         self.add(pr.RemoteVariable(
             name      = 'MonEnable',
             offset    = 0,
@@ -125,9 +187,9 @@ class MigIlvToPcieDma(pr.Device):
         ))
 
         self.add(MigChannel(
-            name      = f'Channel[0]',
-            offset    = 0x80,
-            blockSize = blockSize,
+            name        = f'Channel[0]',
+            offset      = 0x80,
+            blockSize   = blockSize,
         ))
 
         for i in range(monClks):
@@ -140,3 +202,31 @@ class MigIlvToPcieDma(pr.Device):
                 mode     = 'RO',
             ))
 
+        # Buffer telemetry and the overflow counters, sampled together every
+        # oflowPeriod seconds while the root polls
+        self.telemetry = l2si_drp.MigTelemetry(self, blockSize=blockSize,
+                                               blockSizeVars=[self.Channel[0].BlockSize],
+                                               period=oflowPeriod,
+                                               onStatus=lambda status, t: self.Channel[0].accumulateOflows(status[0], t))
+        self._pollGate = l2si_drp.PollGate(self.telemetry)
+
+    def _start(self):
+        super()._start()
+        self._pollGate.start(self.root)
+
+    def _stop(self):
+        self._pollGate.stop()
+        super()._stop()
+
+    def addClkRates(self, mon):
+        for name,v in self.variables.items():
+            if name.startswith('MonClkRate_'):
+                mon.addRate(v)
+
+    def getStatus(self):
+        # Single interleaved channel; keep the same array shape as MigToPcieDma
+        return l2si_drp.decodeMigStatus(
+            self._rawRead(offset=0x80, numWords=l2si_drp.MIG_ILV_CHANNEL_WORDS),
+            blockSize    = self._blockSize,
+            channelWords = l2si_drp.MIG_ILV_CHANNEL_WORDS,
+            oflows       = True)
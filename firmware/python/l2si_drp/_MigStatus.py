@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import numpy as np
+
+# 32-bit words per MigChannel register window (MigToPcieDma.vhd)
+MIG_CHANNEL_WORDS     = 8
+# MigIlvToPcieDma adds the overflow counters at 0x1c-0x23
+MIG_ILV_CHANNEL_WORDS = 9
+
+def migStatusDtype(oflows=False):
+    fields = [
+        ('BlockSize',          np.uint8),
+        ('BlocksPause',        np.uint32),
+        ('BlocksFree',         np.uint32),
+        ('BlocksQueued',       np.uint32),
+        ('WriteQueCnt',        np.uint32),
+        ('WriteIndex',         np.uint32),
+        ('WriteCompleteIndex', np.uint32),
+        ('ReadIndex',          np.uint32),
+    ]
+    if oflows:
+        fields += [
+            ('ibAxisOflows',   np.uint8),
+            ('dmaOflows',      np.uint8),
+            ('hwIbOflow',      np.uint8, (4,)),
+        ]
+    return np.dtype(fields)
+
+def decodeMigStatus(words, blockSize=21, channelWords=MIG_CHANNEL_WORDS, oflows=False):
+    # One row per channel; fields follow the MigChannel RemoteVariables
+    w    = np.asarray(words, dtype=np.uint32).reshape(-1, channelWords)
+    mask = np.uint32((1<<(30-blockSize))-1)
+
+    s = np.empty(w.shape[0], dtype=migStatusDtype(oflows))
+    s['BlockSize']          = w[:,0] & 0xf
+    s['BlocksPause']        = (w[:,1] >> 8) & mask
+    s['BlocksFree']         = w[:,2] & mask
+    s['BlocksQueued']       = (w[:,2] >> 12) & mask
+    s['WriteQueCnt']        = w[:,3] & mask
+    s['WriteIndex']         = w[:,4] & mask
+    s['WriteCompleteIndex'] = w[:,5] & mask
+    s['ReadIndex']          = w[:,6] & mask
+
+    if oflows:
+        b = w[:,7:9].astype('<u4').view(np.uint8).reshape(-1, 8)
+        s['ibAxisOflows'] = b[:,0]
+        s['dmaOflows']    = b[:,1]
+        s['hwIbOflow']    = b[:,4:8]
+
+    return s
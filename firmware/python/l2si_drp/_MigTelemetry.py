@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the 'Camera link gateway'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the 'Camera link gateway', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import logging
+import threading
+import time
+
+import numpy as np
+
+# The BlockSize register holds log2(block bytes) - 17 (4 = 2 MB, AppMigPkg.vhd)
+MIG_BLOCK_SIZE_BASE = 17
+
+class MigTelemetry(object):
+    # Per-lane fill/drain rates and backlog of the MIG buffer, derived from
+    # successive MigToPcieDma/MigIlvToPcieDma.getStatus() samples every
+    # period seconds.  Blocks are 2**blockSize bytes and the indices are
+    # (30-blockSize) bits wide; blockSizeVars (the per-lane BlockSize
+    # registers) are read once at start() and override blockSize.  Each
+    # status read is also passed to onStatus(status, t) when given.
+    def __init__(self, dma, blockSize=21, depth=1024, blockSizeVars=None, period=1.0, onStatus=None):
+        self._dma        = dma
+        self._blockSizeVars = blockSizeVars
+        self._onStatus   = onStatus
+        self._setBlockSize(blockSize)
+        self._depth      = depth
+        self.period      = period
+        self._lock       = threading.Lock()
+        self._history    = None
+        self._head       = 0
+        self._count      = 0
+        self._last       = None
+        self._thread     = None
+        self._stopped    = threading.Event()
+        self._log        = logging.getLogger(__name__)
+
+    def _setBlockSize(self, blockSize):
+        blockSize        = np.asarray(blockSize, dtype=np.int64)
+        self._mask       = (1<<(30-blockSize))-1
+        self._blockBytes = (1<<blockSize).astype(np.float64)
+
+    def _readBlockSize(self):
+        if self._blockSizeVars:
+            try:
+                self._setBlockSize([MIG_BLOCK_SIZE_BASE+v.get() for v in self._blockSizeVars])
+            except Exception as e:
+                self._log.warning(f'BlockSize read failed, keeping the configured size: {e}')
+
+    def _dtype(self, lanes):
+        return np.dtype([
+            ('time',        np.float64),
+            ('fillRate',    np.float64, (lanes,)),  # blocks/s written to the MIG
+            ('drainRate',   np.float64, (lanes,)),  # blocks/s read out to the host
+            ('inFlight',    np.uint32,  (lanes,)),  # written but not yet read
+            ('bytesPerSec', np.float64, (lanes,)),  # host throughput
+        ])
+
+    def sample(self, status=None):
+        if status is None:
+            status = self._dma.getStatus()
+        t   = time.monotonic()
+        idx = np.stack([status['WriteCompleteIndex'], status['ReadIndex']]).astype(np.int64)
+        if self._onStatus is not None:
+            self._onStatus(status, t)
+
+        with self._lock:
+            if self._history is None:
+                self._history = np.zeros(self._depth, dtype=self._dtype(idx.shape[1]))
+            last, self._last = self._last, (t, idx)
+            if last is None:
+                return None
+
+            d   = (idx - last[1]) & self._mask
+            dt  = t - last[0]
+            rec = self._history[self._head]
+            rec['time']        = t
+            rec['fillRate']    = d[0]/dt
+            rec['drainRate']   = d[1]/dt
+            rec['inFlight']    = (idx[0]-idx[1]) & self._mask
+            rec['bytesPerSec'] = rec['drainRate']*self._blockBytes
+            self._head  = (self._head+1) % self._depth
+            self._count = min(self._count+1, self._depth)
+            return rec.copy()
+
+    def history(self):
+        # Samples in time order, oldest first
+        with self._lock:
+            if self._history is None:
+                return None
+            return np.roll(self._history, -self._head)[self._depth-self._count:]
+
+    def latest(self):
+        with self._lock:
+            if self._count == 0:
+                return None
+            return self._history[self._head-1].copy()
+
+    def keepingUp(self, window=10):
+        # True per lane when the host drained at least what was filled
+        h = self.history()
+        if h is None or len(h) == 0:
+            return None
+        h = h[-window:]
+        return h['drainRate'].sum(axis=0) >= h['fillRate'].sum(axis=0)
+
+    def start(self):
+        if self._thread is None:
+            self._readBlockSize()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.period):
+            try:
+                self.sample()
+            except Exception as e:
+                self._log.warning(f'MIG telemetry sample failed: {e}')
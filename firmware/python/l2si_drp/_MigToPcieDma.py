@@ -9,6 +9,7 @@
 # contained in the LICENSE.txt file.
 #-----------------------------------------------------------------------------
 import pyrogue as pr
+import l2si_drp
 
 class MigChannel(pr.Device):
     def __init__(self,
@@ -22,6 +23,8 @@ class MigChannel(pr.Device):
             **kwargs
         )
 
+        self._blockSize = blockSize
+
         self.add(pr.RemoteVariable(
             name      = 'BlockSize',
             offset    = 0x00,
@@ -80,6 +83,14 @@ class MigChannel(pr.Device):
             mode      = 'RO',
         ))
 
+    def getStatus(self):
+        # Whole channel window in one transaction
+        return l2si_drp.decodeMigStatus(
+            self._rawRead(offset=0, numWords=l2si_drp.MIG_CHANNEL_WORDS),
+            blockSize    = self._blockSize,
+            channelWords = l2si_drp.MIG_CHANNEL_WORDS,
+            oflows       = False)[0]
+
 class MigToPcieDma(pr.Device):
     def __init__(self,
                  name        = 'MigToPcieDma',
@@ -94,6 +105,9 @@ class MigToPcieDma(pr.Device):
             **kwargs
         )
 
+        self._numLanes  = numLanes
+        self._blockSize = blockSize
+
         self.add(pr.RemoteVariable(
             name      = 'MonEnable',
             offset    = 0,
@@ -118,3 +132,28 @@ class MigToPcieDma(pr.Device):
                 mode     = 'RO',
             ))
 
+        # Buffer telemetry, sampled while the root polls
+        self.telemetry = l2si_drp.MigTelemetry(self, blockSize=blockSize,
+                                               blockSizeVars=[self.Channel[i].BlockSize for i in range(numLanes)])
+        self._pollGate = l2si_drp.PollGate(self.telemetry)
+
+    def _start(self):
+        super()._start()
+        self._pollGate.start(self.root)
+
+    def _stop(self):
+        self._pollGate.stop()
+        super()._stop()
+
+    def addClkRates(self, mon):
+        for name,v in self.variables.items():
+            if name.startswith('MonClkRate_'):
+                mon.addRate(v)
+
+    def getStatus(self):
+        # All lanes' channel windows (0x80+32*i) in one transaction
+        return l2si_drp.decodeMigStatus(
+            self._rawRead(offset=0x80, numWords=l2si_drp.MIG_CHANNEL_WORDS*self._numLanes),
+            blockSize    = self._blockSize,
+            channelWords = l2si_drp.MIG_CHANNEL_WORDS,
+            oflows       = False)
@@ -15,8 +15,16 @@ import pyrogue.utilities.prbs
 
 class PcieControl(pr.Device):
 
-    def __init__(self,devname='/dev/datadev_1',tdet=True,gpu=False,**kwargs):
-        pr.Device.__init__(self,name=f'PcieControl',**kwargs)
-        
-        self._dataMap = rogue.hardware.axi.AxiMemMap(devname)
-        self.add(l2si_drp.DevKcu1500(memBase=self._dataMap,expand=True,tdet=tdet,gpu=gpu))
+    def __init__(self,name='PcieControl',devname='/dev/datadev_1',tdet=True,gpu=False,memMap=None,devices=None,**kwargs):
+        pr.Device.__init__(self,name=name,**kwargs)
+
+        self.devname = devname
+
+        # 'sim' selects the behavioral register model instead of the driver
+        if memMap is not None:
+            self._dataMap = memMap
+        elif devname == 'sim':
+            self._dataMap = l2si_drp.SimMemory(tdet=tdet)
+        else:
+            self._dataMap = rogue.hardware.axi.AxiMemMap(devname)
+        self.add(l2si_drp.DevKcu1500(memBase=self._dataMap,expand=True,tdet=tdet,gpu=gpu,devices=devices))
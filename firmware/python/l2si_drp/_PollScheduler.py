@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pyrogue as pr
+import l2si_drp
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+# Base poll period (s) per device class.  Devices below a listed device
+# inherit its period; devices with no listed ancestor are not polled.
+# Devices behind the I2C mux are read through the bus scheduler; the shared
+# QSFP window is never polled (I2CBus.getQsfpDiagnostics covers it).
+POLL_PERIODS = {
+    'MigChannel'    : 0.25,
+    'TimingFrameRx' : 0.5,
+    'Si570'         : 30.0,
+}
+
+def isReadable(v):
+    return isinstance(v, pr.RemoteVariable) and not isinstance(v, pr.BaseCommand) and v.mode != 'WO'
+
+def behindMux(dev):
+    # dev is the I2C bus or sits behind its mux
+    return isinstance(dev, l2si_drp.I2CBus) or l2si_drp.i2cTarget(dev) is not None
+
+def monitoredVariables(dev, periods=None, period=None):
+    # [(variable, base period)] for the readable remote variables under dev
+    periods = POLL_PERIODS if periods is None else periods
+    bus = l2si_drp.i2cTarget(dev)
+    if bus is not None and bus[1] is None:
+        return []
+    p = next((periods[c.__name__] for c in type(dev).__mro__ if c.__name__ in periods), period)
+    ret = []
+    if p is not None:
+        ret += [(v,p) for v in dev.variables.values() if isReadable(v)]
+    for d in dev.devices.values():
+        ret += monitoredVariables(d, periods, p)
+    return ret
+
+def blockVariables(variables):
+    # {block:[variables]} in address order; the first variable of each
+    # block stands for it in the per-block read/write/check calls
+    blocks = collections.OrderedDict()
+    for v in sorted(variables, key=lambda v: v.address):
+        blocks.setdefault(getattr(v, '_block', v), []).append(v)
+    return blocks
+
+def _readBlocks(root, variables):
+    blocks = [vs[0] for vs in blockVariables(variables).values()]
+
+    with root.updateGroup():
+        for v in blocks:
+            v.parent.readBlocks(recurse=False, variable=v)
+        for v in blocks:
+            v.parent.checkBlocks(recurse=False, variable=v)
+    return len(blocks)
+
+def readVariables(root, variables):
+    # One read per block, issued in address order before a single check
+    # pass; returns the number of transactions.  Variables behind the I2C
+    # mux are read as a group through the bus scheduler with the mux on
+    # their target; those with no fixed target are skipped.
+    groups = collections.OrderedDict()
+    buses  = {}
+    for v in variables:
+        if v.parent not in buses:
+            buses[v.parent] = l2si_drp.i2cTarget(v.parent)
+        groups.setdefault(buses[v.parent], []).append(v)
+
+    n = 0
+    for target,vs in groups.items():
+        if target is None:
+            n += _readBlocks(root, vs)
+        elif target[1] is not None:
+            n += target[0].run(target[1], lambda vs=vs: _readBlocks(root, vs))
+    return n
+
+def pollingEnabled(root):
+    # PollEn, or per class polling (pollPeriods) on the l2si_drp roots
+    return bool(root.PollEn.value()) or getattr(root, 'pollScheduler', None) is not None
+
+class PollGate(object):
+    # Runs background monitors (objects with start()/stop()) while the root
+    # polls and follows PollEn changes.  Devices call start(root)/stop() from
+    # their _start/_stop hooks.
+    def __init__(self, *monitors):
+        self._monitors = monitors
+        self._lock     = threading.Lock()
+        self._root     = None
+        self._running  = False
+
+    def start(self, root):
+        with self._lock:
+            if self._root is None:
+                root.PollEn.addListener(self._update)
+            self._root    = root
+            self._running = True
+        self._update()
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+        self._update()
+
+    def _update(self, *args):
+        with self._lock:
+            on = self._running and pollingEnabled(self._root)
+            for m in self._monitors:
+                if on:
+                    m.start()
+                else:
+                    m.stop()
+
+class PollScheduler(object):
+    # Replaces uniform pyrogue polling.  Each variable is polled at its
+    # device class period, halved while its value keeps changing and
+    # stretched while it is stable, within [period/speedup, period*slowdown].
+    # The variables due on a tick are read as one batch: one transaction per
+    # block in address order, all issued before waiting for any of them.
+    def __init__(self, root, periods=None, speedup=4, slowdown=8):
+        self._root     = root
+        self._periods  = POLL_PERIODS if periods is None else periods
+        self._speedup  = speedup
+        self._slowdown = slowdown
+        self._lock     = threading.Lock()
+        self._entries  = []
+        self._thread   = None
+        self._stopped  = threading.Event()
+        self._log      = logging.getLogger(__name__)
+        self.ticks     = 0
+        self.reads     = 0
+
+    def build(self):
+        with self._lock:
+            self._entries = [{
+                'variable' : v,
+                'base'     : p,
+                'period'   : p,
+                'due'      : 0.,
+                'last'     : None,
+            } for v,p in monitoredVariables(self._root, self._periods)]
+
+    def periods(self):
+        # Current adaptive period per variable path
+        with self._lock:
+            return {e['variable'].path:e['period'] for e in self._entries}
+
+    def tick(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            due = [e for e in self._entries if e['due'] <= now]
+        if not due:
+            return 0
+
+        reads = readVariables(self._root, [e['variable'] for e in due])
+
+        with self._lock:
+            for e in due:
+                value = e['variable'].value()
+                if e['last'] is not None and not np.array_equal(value, e['last']):
+                    e['period'] = max(e['base']/self._speedup, e['period']/2)
+                else:
+                    e['period'] = min(e['base']*self._slowdown, e['period']*1.5)
+                e['last'] = value
+                e['due']  = now + e['period']
+
+        self.ticks += 1
+        self.reads += reads
+        return reads
+
+    def _nextDue(self):
+        with self._lock:
+            return min((e['due'] for e in self._entries), default=None)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            due = self._nextDue()
+            if due is None:
+                break
+            if self._stopped.wait(max(0., due-time.monotonic())):
+                break
+            try:
+                self.tick()
+            except Exception as e:
+                self._log.warning(f'Poll failed: {e}')
+                self._stopped.wait(1.)
+
+    def start(self):
+        if self._thread is None:
+            self.build()
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+#
+#  Flat register map of a root variant: absolute address, bit fields and mode
+#  of every remote variable plus the contiguous blocks covering them.  The
+#  map depends on the firmware build and on the Python device definitions,
+#  so it is cached on disk keyed by the AxiVersion BuildStamp, the commits
+#  (or versions) of the definition packages and the devices selection, and
+#  tools can decode raw reads from it without building the pyrogue tree.
+#
+
+import pyrogue as pr
+import l2si_drp
+import functools
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import subprocess
+
+import numpy as np
+
+REGISTER_MAP_VERSION = 1
+
+# AxiVersion.BuildStamp, 256 bytes at AxiPcieCore.AxiVersion + 0x800
+BUILD_STAMP_ADDR  = 0x0002_0800
+BUILD_STAMP_WORDS = 64
+
+# PcieControl arguments per root variant
+VARIANTS = {
+    'DrpTDet'    : {'tdet':True,  'gpu':False},
+    'DrpTDetGpu' : {'tdet':True,  'gpu':True },
+    'DrpPgpIlv'  : {'tdet':False, 'gpu':False},
+}
+
+def _aslist(x):
+    return list(x) if isinstance(x, (list, tuple)) else [x]
+
+# Packages whose device classes make up the tree
+DEFINITION_PACKAGES = ('l2si_drp', 'surf', 'axipcie', 'LclsTimingCore', 'l2si_core')
+
+def _packageId(name):
+    # Last git commit touching the package source (empty when it is not
+    # tracked), else its installed version.  Edits not yet committed are not
+    # seen; bump REGISTER_MAP_VERSION for those.
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None:
+        return None
+    if spec.submodule_search_locations:
+        try:
+            commit = subprocess.run(['git', '-C', list(spec.submodule_search_locations)[0], 'log', '-1', '--format=%H', '--', '.'],
+                                    capture_output=True, text=True, timeout=5, check=True).stdout.strip()
+            if commit:
+                return commit
+        except (OSError, subprocess.SubprocessError):
+            pass
+    try:
+        return importlib.metadata.version(name)
+    except importlib.metadata.PackageNotFoundError:
+        return None
+
+@functools.lru_cache(maxsize=None)
+def definitionsId():
+    # Identifies the device definition packages independently of which of
+    # their modules a tool happens to have imported
+    ids = [str(REGISTER_MAP_VERSION)] + [f'{name}={_packageId(name)}' for name in DEFINITION_PACKAGES]
+    return hashlib.sha1(';'.join(ids).encode()).hexdigest()[:16]
+
+def readBuildStamp(memMap):
+    w = l2si_drp.memProbe(memMap)._rawRead(offset=BUILD_STAMP_ADDR, numWords=BUILD_STAMP_WORDS)
+    b = b''.join(int(x).to_bytes(4, 'little') for x in w)
+    return b.split(b'\0', 1)[0].decode(errors='replace')
+
+def planBlocks(variables, maxBytes=1024, modes=('RO', 'RW')):
+    # Word aligned, contiguous read ranges covering the variables
+    spans = []
+    for path, v in variables.items():
+        if v['mode'] not in modes:
+            continue
+        lo = v['address'] + min(v['bitOffset'])//8
+        hi = v['address'] + (max(o+s for o,s in zip(v['bitOffset'], v['bitSize']))+7)//8
+        spans.append((lo & ~3, (hi+3) & ~3, path))
+    spans.sort()
+
+    blocks = []
+    for lo, hi, path in spans:
+        b = blocks[-1] if blocks else None
+        if b is not None and lo <= b['end'] and max(hi, b['end'])-b['address'] <= maxBytes:
+            b['end'] = max(hi, b['end'])
+            b['variables'].append(path)
+        else:
+            blocks.append({'address':lo, 'end':hi, 'variables':[path]})
+    return [{'address':b['address'], 'words':(b['end']-b['address'])//4,
+             'variables':b['variables']} for b in blocks]
+
+def _collect(dev, prefix, base, variables):
+    for v in dev.variables.values():
+        if isinstance(v, pr.RemoteVariable) and not isinstance(v, pr.BaseCommand):
+            variables[prefix+v.name] = {
+                'address'   : base + v.offset,
+                'bitOffset' : _aslist(v.bitOffset),
+                'bitSize'   : _aslist(v.bitSize),
+                'mode'      : v.mode,
+                'typeStr'   : v.typeStr,
+            }
+    for d in dev.devices.values():
+        _collect(d, f'{prefix}{d.name}.', base + d.offset, variables)
+
+def _devicesKey(devices):
+    return 'all' if devices is None else ','.join(sorted(devices))
+
+def buildRegisterMap(dev, variant=None, buildStamp=None, devices=None):
+    # Index of the remote variables under dev, the top of its memory map
+    # (PcieControl built with devices).  Paths start at dev's name, as they
+    # do below the root.
+    variables = {}
+    _collect(dev, f'{dev.name}.', 0, variables)
+    return RegisterMap({
+        'version'     : REGISTER_MAP_VERSION,
+        'definitions' : definitionsId(),
+        'variant'     : variant,
+        'devices'     : _devicesKey(devices),
+        'buildStamp'  : buildStamp,
+        'variables'   : variables,
+        'blocks'      : planBlocks(variables),
+    })
+
+def registerMapFile(variant, buildStamp, cacheDir='~/.l2si_drp/regmap', devices=None):
+    key = hashlib.sha1(f'{buildStamp}:{definitionsId()}:{_devicesKey(devices)}'.encode()).hexdigest()[:16]
+    return os.path.join(os.path.expanduser(cacheDir), f'{variant}-{key}.json')
+
+def registerMap(variant, memMap=None, buildStamp=None, cacheDir='~/.l2si_drp/regmap', devices=None):
+    # Cached index for the firmware behind memMap (or the given stamp) and
+    # the root variant built with devices (default all); the tree is only
+    # built when the cache misses
+    if buildStamp is None:
+        buildStamp = readBuildStamp(memMap)
+    fname = registerMapFile(variant, buildStamp, cacheDir, devices)
+    if os.path.exists(fname):
+        rmap = RegisterMap.load(fname)
+        if rmap.version == REGISTER_MAP_VERSION and rmap.buildStamp == buildStamp and \
+           rmap.index.get('definitions') == definitionsId() and \
+           rmap.index.get('devices') == _devicesKey(devices):
+            return rmap
+
+    dev  = l2si_drp.PcieControl(devname='sim', devices=devices, **VARIANTS[variant])
+    rmap = buildRegisterMap(dev, variant, buildStamp, devices)
+    rmap.save(fname)
+    return rmap
+
+class RegisterMap(object):
+    def __init__(self, index):
+        self.index      = index
+        self.version    = index['version']
+        self.variant    = index['variant']
+        self.buildStamp = index['buildStamp']
+        self.variables  = index['variables']
+        self.blocks     = index['blocks']
+
+    @classmethod
+    def load(cls, fname):
+        with open(fname) as f:
+            return cls(json.load(f))
+
+    def save(self, fname):
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        tmp = fname + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(tmp, fname)
+
+    def blocksFor(self, prefix):
+        # Blocks holding variables under prefix, trimmed to those variables
+        sub = {p:v for p,v in self.variables.items() if p.startswith(prefix)}
+        return planBlocks(sub)
+
+    def decode(self, address, words, paths=None):
+        # {path:value} for the variables inside the words read at address.
+        # words may carry leading sample dimensions (..., n); fields up to
+        # 64 bits decode to uint64 arrays, wider ones need a 1-D read.
+        words = np.asarray(words, dtype=np.uint32)
+        data  = np.ascontiguousarray(words).view(np.uint8)
+        end   = address + 4*words.shape[-1]
+        ret   = {}
+        for path in (paths if paths is not None else self.variables):
+            v    = self.variables[path]
+            offs = v['bitOffset']
+            lo   = v['address'] + min(offs)//8
+            hi   = v['address'] + (max(o+s for o,s in zip(offs, v['bitSize']))+7)//8
+            if lo < address or hi > end:
+                continue
+            if sum(v['bitSize']) <= 64 and all(o%8+s <= 64 for o,s in zip(offs, v['bitSize'])):
+                val, pos = np.zeros(words.shape[:-1], dtype=np.uint64), 0
+                for o,s in zip(offs, v['bitSize']):
+                    first = v['address'] - address + o//8
+                    raw   = np.zeros(words.shape[:-1], dtype=np.uint64)
+                    for k in range((o%8+s+7)//8):
+                        raw |= data[..., first+k].astype(np.uint64) << np.uint64(8*k)
+                    field = (raw >> np.uint64(o%8)) & np.uint64((1<<s)-1)
+                    val  |= field << np.uint64(pos)
+                    pos  += s
+                ret[path] = int(val) if words.ndim == 1 else val
+            elif words.ndim == 1:
+                b = data.tobytes()
+                val, pos = 0, 0
+                for o,s in zip(offs, v['bitSize']):
+                    first = v['address'] - address
+                    raw   = int.from_bytes(b[first:first+(o+s+7)//8], 'little')
+                    val  |= ((raw >> o) & ((1<<s)-1)) << pos
+                    pos  += s
+                ret[path] = val
+        return ret
+
+    def read(self, memMap, blocks=None):
+        # Raw read of the planned blocks, decoded; no pyrogue tree involved
+        probe = l2si_drp.memProbe(memMap, name='RegisterMapProbe')
+        ret   = {}
+        for b in (self.blocks if blocks is None else blocks):
+            w = probe._rawRead(offset=b['address'], numWords=b['words'])
+            ret.update(self.decode(b['address'], _aslist(w), b['variables']))
+        return ret
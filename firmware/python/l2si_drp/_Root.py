@@ -10,46 +10,428 @@
 import pyrogue as pr
 import l2si_drp
 import pyrogue.interfaces
+import concurrent.futures
+import glob
 import logging
+import threading
+import time
+
+def setSi570BoardId(card):
+    # Key the card's cached Si570 crystal calibration by its FPGA DNA
+    dev = card.DevKcu1500
+    if 'AxiPcieCore' in dev.nodes and 'I2CBus' in dev.nodes:
+        dev.I2CBus.Si570.boardId = f'{dev.AxiPcieCore.AxiVersion.DeviceDna.get():x}'
+
+def muxSplit(dev, recurse=True):
+    # ([(device, recurse)], [variables]) covering dev's subtree: devices read
+    # block by block and the variables behind the I2C mux
+    if l2si_drp.behindMux(dev):
+        return [], [v for v in (dev.variableList if recurse else dev.variables.values()) if l2si_drp.isReadable(v)]
+    if not recurse or not any(l2si_drp.behindMux(d) for d in dev.deviceList):
+        return [(dev,recurse)], []
+    items, muxed = [(dev,False)], []
+    for d in dev.devices.values():
+        i, m   = muxSplit(d)
+        items += i
+        muxed += m
+    return items, muxed
+
+def readItems(root, items):
+    # Bulk read of (device, recurse) items; the I2C devices are read per mux
+    # target through the bus scheduler (readVariables)
+    direct, muxed = [], []
+    for dev,recurse in items:
+        i, m    = muxSplit(dev, recurse)
+        direct += i
+        muxed  += m
+    with root.updateGroup():
+        for dev,recurse in direct:
+            dev.readBlocks(recurse=recurse)
+        for dev,recurse in direct:
+            dev.checkBlocks(recurse=recurse)
+        if muxed:
+            l2si_drp.readVariables(root, muxed)
 
 class Root(pr.Root):
 
-    def __init__(self,name,description,pollEn,devname,gpu):
+    # Initial read tiers, in order.  'critical' is read before start() returns,
+    # 'default' is the rest of the tree and 'slow' (the I2C devices) follows
+    # it in the background.  Paths are relative to the root.
+    readTierPaths = {
+        'critical' : ['PcieControl.DevKcu1500.AxiPcieCore.AxiVersion',
+                      'PcieControl.DevKcu1500.MigToPcieDma',
+                      'PcieControl.DevKcu1500.MigIlvToPcieDma',
+                      'PcieControl.DevKcu1500.TDetTiming.TimingFrameRx'],
+        'default'  : [],
+        'slow'     : ['PcieControl.DevKcu1500.I2CBus'],
+    }
+
+    def __init__(self,name,description,pollEn,devname,gpu,tdet=True,devices=None,initRead='tiered',pollPeriods=None,snapshotPeriod=None,memMap=None,metricsPort=None,dmaLanes=None,
+                 memPath=None,host='localhost',port=8000,histLane=None,histRollover=True):
         pr.Root.__init__(self,name=name,description=description,pollEn=pollEn)
 
-        self.add(l2si_drp.PcieControl(devname=devname, expand=True, gpu=gpu))
+        # dest 0 of a lane is opened once, for either the DAQ data or the histogram
+        if histLane is not None and dmaLanes and histLane in dmaLanes:
+            raise ValueError(f'{name}: histLane {histLane} is also in dmaLanes')
+
+        # memPath 'direct', 'bridge' (rogue TCP bridge at host:port) or 'auto'
+        # picks the register and DMA path; None keeps the driver (or 'sim'
+        # model) registers
+        self.memPath = None
+        if memPath is not None:
+            self.memPath = l2si_drp.selectMemPath(devname, memPath)
+            if memMap is None:
+                memMap = l2si_drp.openMemMap(devname, self.memPath, host, port)
+
+        self.add(l2si_drp.PcieControl(devname=devname, expand=True, tdet=tdet, gpu=gpu, devices=devices, memMap=memMap))
+
+        # Receive stages for the DAQ data (dest 0) of dmaLanes, null sinks
+        # until setConsumer()
+        self.receivers = {}
+        if dmaLanes:
+            self.dmaStreams = l2si_drp.openDmaStreams(devname, {lane:{0} for lane in dmaLanes},
+                                                      self.memPath or l2si_drp.selectMemPath(devname),
+                                                      host, port)
+            for lane in dmaLanes:
+                self.receivers[lane] = l2si_drp.DmaReceiver(lane)
+                self.dmaStreams[lane][0] >> self.receivers[lane]
+
+                self.add(pr.LocalVariable(
+                    name        = f'RxFrameRate[{lane}]',
+                    mode        = 'RO',
+                    value       = 0.0,
+                    units       = 'Hz',
+                    disp        = '{:.1f}',
+                    localGet    = lambda lane=lane: self.receivers[lane].rates()[0],
+                ))
+
+                self.add(pr.LocalVariable(
+                    name        = f'RxByteRate[{lane}]',
+                    mode        = 'RO',
+                    value       = 0.0,
+                    units       = 'B/s',
+                    disp        = '{:.3g}',
+                    localGet    = lambda lane=lane: self.receivers[lane].rates()[1],
+                ))
+
+                self.add(pr.LocalVariable(
+                    name        = f'RxDrops[{lane}]',
+                    mode        = 'RO',
+                    value       = 0,
+                    localGet    = lambda lane=lane: self.receivers[lane].drops,
+                ))
+
+        # AxisHistogram monitor stream on dest 0 of histLane (MonEnable
+        # gates it in firmware); histRollover follows ROLLOVER_EN_G
+        self.histogram = None
+        if histLane is not None:
+            self.histogram   = l2si_drp.AxisHistogramReceiver(rollover=histRollover)
+            self._histStream = l2si_drp.openDmaStreams(devname, {histLane:{0}},
+                                                       self.memPath or l2si_drp.selectMemPath(devname),
+                                                       host, port)[histLane][0]
+            self._histStream >> self.histogram
+
+            self.add(pr.LocalVariable(
+                name        = 'HistFrames',
+                mode        = 'RO',
+                value       = 0,
+                localGet    = lambda: self.histogram.accumulator.frames,
+            ))
+
+        if self.memPath is not None:
+            self.add(pr.LocalVariable(
+                name        = 'MemPath',
+                description = 'Register and DMA path in use (direct or bridge)',
+                mode        = 'RO',
+                value       = self.memPath,
+            ))
 
-        self.zmqServer = pyrogue.interfaces.ZmqServer(root=self, addr='127.0.0.1', port=0)
+            self.add(pr.LocalVariable(
+                name        = 'MemLatency',
+                description = 'Median register read round trip, measured at start',
+                mode        = 'RO',
+                value       = 0.0,
+                units       = 's',
+                disp        = '{:.3e}',
+            ))
+
+        # snapshotPeriod serves clients from one periodic read of the
+        # monitored registers instead of a hardware read per request
+        if snapshotPeriod:
+            self.zmqServer = l2si_drp.SnapshotServer(root=self, addr='127.0.0.1', port=0, period=snapshotPeriod)
+        else:
+            self.zmqServer = pyrogue.interfaces.ZmqServer(root=self, addr='127.0.0.1', port=0)
         self.addInterface(self.zmqServer)
 
+        # OpenMetrics endpoint on localhost; metricsPort 0 picks a free port
+        self.metrics = None
+        if metricsPort is not None:
+            self.metrics = l2si_drp.MetricsExporter(self, port=metricsPort)
+
+        # initRead: 'tiered', 'all' (blocking ReadAll) or None
+        self._initRead   = initRead
+        self._tierThread = None
+        self.readDone    = {tier:threading.Event() for tier in self.readTierPaths}
+        self.readErrors  = {}
+
+        # Background clock rate estimates for the devices that have counters,
+        # sampled while the tree is polled (PollEn or pollPeriods)
+        self.clkRates  = l2si_drp.ClkRateMonitor()
+        self._pollGate = l2si_drp.PollGate(self.clkRates)
+        for dev in self.PcieControl.DevKcu1500.devices.values():
+            if hasattr(dev, 'addClkRates'):
+                dev.addClkRates(self.clkRates)
+
+        # Per device class polling in place of pollEn; pollPeriods is True
+        # for the default periods or a {class name:period} dict
+        self.pollScheduler = None
+        if pollPeriods:
+            self.pollScheduler = l2si_drp.PollScheduler(
+                self, periods=None if pollPeriods is True else pollPeriods)
+
+    def _tierItems(self, dev, tier):
+        # (device, recurse) pairs covering dev's subtree that belong to tier
+        paths = {t:[f'{self.name}.{p}' for p in ps] for t,ps in self.readTierPaths.items()}
+        owner = next((t for t,ps in paths.items() if dev.path in ps), None)
+        if owner is not None:
+            return [(dev,True)] if owner == tier else []
+        if any(p.startswith(dev.path+'.') for ps in paths.values() for p in ps):
+            items = [(dev,False)] if tier == 'default' else []
+            for d in dev.devices.values():
+                items += self._tierItems(d, tier)
+            return items
+        return [(dev,True)] if tier == 'default' else []
+
+    def setConsumer(self, consumer, lanes=None):
+        # consumer(DmaFrame) for the given lanes (default all); None restores
+        # the null sink
+        for lane in (self.receivers if lanes is None else lanes):
+            self.receivers[lane].setConsumer(consumer)
+
+    def transaction(self, verify=True, raiseOnError=True):
+        # with root.transaction() as t: t.set(variable or path, value) ...
+        # writes everything on exit as merged block writes and one verify pass
+        return l2si_drp.RegisterTransaction(self, verify=verify, raiseOnError=raiseOnError)
+
+    def readTier(self, tier):
+        # readDone[tier] is set even when the read fails, so waiters never
+        # block; the failure is kept in readErrors[tier]
+        try:
+            readItems(self, self._tierItems(self, tier))
+        except Exception as e:
+            self.readErrors[tier] = e
+            raise
+        finally:
+            self.readDone[tier].set()
+
+    def _readTiers(self, tiers):
+        for tier in tiers:
+            try:
+                self.readTier(tier)
+            except Exception as e:
+                logging.getLogger(__name__).warning(f'Read of tier {tier} failed: {e}')
+
     def start(self,**kwargs):
         super().start(**kwargs)
-        self.ReadAll()
 
-        if self.PcieControl.DevKcu1500.AxiPcieCore.AxiVersion.DRIVER_TYPE_ID_G.get()==0:
+        self.readErrors = {}
+        for tier in self.readDone.values():
+            tier.clear()
+
+        if self._initRead == 'all':
+            self.ReadAll()
+            for tier in self.readDone.values():
+                tier.set()
+        elif self._initRead == 'tiered':
+            tiers = list(self.readTierPaths)
+            self.readTier(tiers[0])
+            self._tierThread = threading.Thread(target=self._readTiers, args=(tiers[1:],), daemon=True)
+            self._tierThread.start()
+
+        dev = self.PcieControl.DevKcu1500
+        if 'AxiPcieCore' in dev.nodes and dev.AxiPcieCore.AxiVersion.DRIVER_TYPE_ID_G.get()==0:
             # remove the I2c bus
             pass
 
+        setSi570BoardId(self.PcieControl)
+
+        if self.memPath is not None:
+            self.MemLatency.set(l2si_drp.memLatency(self.PcieControl._dataMap))
+            logging.getLogger(__name__).info(
+                f'{self.name}: {self.memPath} register path, {self.MemLatency.value()*1.e6:.1f} us round trip')
+
+        for rx in self.receivers.values():
+            rx.start()
+        self._pollGate.start(self)
+        if self.pollScheduler is not None:
+            self.pollScheduler.start()
+        if self.metrics is not None:
+            self.metrics.start()
+
+    def stop(self):
+        if self.metrics is not None:
+            self.metrics.stop()
+        if self.pollScheduler is not None:
+            self.pollScheduler.stop()
+        self._pollGate.stop()
+        for rx in self.receivers.values():
+            rx.stop()
+        if self._tierThread is not None:
+            self._tierThread.join()
+        super().stop()
+
 class DrpTDetRoot(Root):
-    def __init__(self,pollEn=True,devname='/dev/datadev_1'):
+    def __init__(self,pollEn=True,devname='/dev/datadev_1',**kwargs):
         Root.__init__(self,name='DrpTDet',description='Timing receiver',
-                      pollEn=pollEn, devname=devname, gpu=False)
+                      pollEn=pollEn, devname=devname, gpu=False, **kwargs)
 
 class DrpTDetGpuRoot(Root):
-    def __init__(self,pollEn=True,devname='/dev/datagpu_0'):
+    def __init__(self,pollEn=True,devname='/dev/datagpu_0',**kwargs):
         Root.__init__(self,name='DrpTDetGpu',description='Timing receiver',
-                      pollEn=pollEn, devname=devname, gpu=True)
+                      pollEn=pollEn, devname=devname, gpu=True, **kwargs)
+
+class DrpPgpIlvRoot(Root):
+    def __init__(self,pollEn=True,devname='/dev/datadev_1',**kwargs):
+        Root.__init__(self,name='DrpPgpIlv',description='HSD receiver',
+                      pollEn=pollEn, devname=devname, gpu=False, tdet=False, **kwargs)
 
-class DrpPgpIlvRoot(pr.Root):
-    def __init__(self,pollEn=True,devname='/dev/datadev_1'):
-        pr.Root.__init__(self,name='DrpPgpIlv',description='HSD receiver',
-                      pollEn=pollEn)
+def findCards(gpu=False):
+    # Driver device nodes present on this host, in card order
+    pattern = '/dev/datagpu_*' if gpu else '/dev/datadev_*'
+    return sorted(glob.glob(pattern), key=lambda d: int(d.rsplit('_',1)[1]))
+
+class MultiCardRoot(pr.Root):
+
+    # One process owning several KCU1500 cards.  Each card is a
+    # PcieControl[i] subtree; reads, snapshots and configuration run on
+    # all cards in parallel and every card is served on one ZMQ endpoint.
+    def __init__(self,name='DrpMulti',description='Multiple DRP cards',pollEn=True,
+                 devnames=None,gpu=False,tdet=True,devices=None,initRead=True,pollPeriods=None,snapshotPeriod=None,
+                 metricsPort=None):
+        pr.Root.__init__(self,name=name,description=description,pollEn=pollEn)
 
-        self.add(l2si_drp.PcieControl(devname=devname, expand=True, tdet=False, gpu=False))
+        if devnames is None:
+            devnames = findCards(gpu)
+        if not devnames:
+            raise RuntimeError(f'{name}: no cards found')
 
-        self.zmqServer = pyrogue.interfaces.ZmqServer(root=self, addr='127.0.0.1', port=0)
+        for i,devname in enumerate(devnames):
+            self.add(l2si_drp.PcieControl(name=f'PcieControl[{i}]', devname=devname,
+                                          tdet=tdet, gpu=gpu, devices=devices))
+
+            self.add(pr.LocalVariable(
+                name        = f'CardOpTime[{i}]',
+                description = 'Duration of the last parallel operation on the card',
+                mode        = 'RO',
+                value       = 0.0,
+                units       = 's',
+                disp        = '{:.3f}',
+            ))
+
+        self.add(pr.LocalCommand(
+            name        = 'ReadAllCards',
+            description = 'Read all cards in parallel',
+            function    = lambda: self.readAll()))
+
+        self.cards      = [self.node(f'PcieControl[{i}]') for i in range(len(devnames))]
+        self.cardTiming = {card.name:{} for card in self.cards}
+        self._opTimes   = [self.node(f'CardOpTime[{i}]') for i in range(len(devnames))]
+        self._initRead  = initRead
+        self._pool      = None
+
+        self.pollScheduler = None
+        if pollPeriods:
+            self.pollScheduler = l2si_drp.PollScheduler(
+                self, periods=None if pollPeriods is True else pollPeriods)
+
+        if snapshotPeriod:
+            self.zmqServer = l2si_drp.SnapshotServer(root=self, addr='127.0.0.1', port=0, period=snapshotPeriod)
+        else:
+            self.zmqServer = pyrogue.interfaces.ZmqServer(root=self, addr='127.0.0.1', port=0)
         self.addInterface(self.zmqServer)
 
+        self.metrics = None
+        if metricsPort is not None:
+            self.metrics = l2si_drp.MetricsExporter(self, port=metricsPort)
+
+    def forEachCard(self, op, func, cards=None):
+        # Run func(card) on every card concurrently.  Returns {card name:result}
+        # (PcieControl[i], unique even when devnames repeat); per-card
+        # durations are kept in cardTiming[name][op].  The first failure is
+        # raised once all cards have finished.
+        cards = self.cards if cards is None else cards
+
+        def timed(card):
+            t0 = time.perf_counter()
+            try:
+                with self.updateGroup():
+                    return func(card)
+            finally:
+                dt = time.perf_counter()-t0
+                self.cardTiming[card.name][op] = dt
+                self._opTimes[self.cards.index(card)].set(dt)
+
+        if self._pool is None:
+            futs = {card:concurrent.futures.Future() for card in cards}
+            for card,fut in futs.items():
+                try:
+                    fut.set_result(timed(card))
+                except Exception as e:
+                    fut.set_exception(e)
+        else:
+            futs = {card:self._pool.submit(timed, card) for card in cards}
+
+        concurrent.futures.wait(futs.values())
+        for card,fut in futs.items():
+            if fut.exception() is not None:
+                raise RuntimeError(f'{card.name} ({card.devname}): {op} failed') from fut.exception()
+        return {card.name:fut.result() for card,fut in futs.items()}
+
+    def readAll(self, cards=None):
+        self.forEachCard('readAll', lambda card: readItems(self, [(card,True)]), cards)
+
+    def snapshot(self, read=True, modes=('RW','RO'), cards=None):
+        # {card name:{path relative to the card:value}}
+        def snap(card):
+            if read:
+                readItems(self, [(card,True)])
+            n = len(card.path)+1
+            return {v.path[n:]:v.value() for v in card.variableList if v.mode in modes}
+        return self.forEachCard('snapshot', snap, cards)
+
+    def configure(self, values, cards=None):
+        # values: {path relative to the card:value}, applied to every card
+        # as one register transaction per card
+        def config(card):
+            with l2si_drp.RegisterTransaction(self) as t:
+                for path,value in values.items():
+                    t.set(f'{card.path}.{path}', value)
+        self.forEachCard('configure', config, cards)
+
+    def transaction(self, verify=True, raiseOnError=True):
+        return l2si_drp.RegisterTransaction(self, verify=verify, raiseOnError=raiseOnError)
+
     def start(self,**kwargs):
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=len(self.cards))
         super().start(**kwargs)
-        self.ReadAll()
+
+        if self._initRead:
+            self.readAll()
+
+        for card in self.cards:
+            setSi570BoardId(card)
+
+        if self.pollScheduler is not None:
+            self.pollScheduler.start()
+        if self.metrics is not None:
+            self.metrics.start()
+
+    def stop(self):
+        if self.metrics is not None:
+            self.metrics.stop()
+        if self.pollScheduler is not None:
+            self.pollScheduler.stop()
+        super().stop()
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
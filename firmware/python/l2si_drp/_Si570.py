@@ -16,14 +16,72 @@
 #
 
 import pyrogue as pr
+import json
+import os
+import tempfile
+import threading
 import time
 
+import numpy as np
+
+# (N1, HS_DIV) candidates in order of preference (low N1, high HS_DIV)
+N1_HS_DIV = np.array([(n1, hs_div) for n1 in [1] + list(range(2, 2**7, 2))
+                                   for hs_div in [11, 9, 7, 6, 5, 4]])
+N1_HS_DIV_PRODUCT = N1_HS_DIV[:,0] * N1_HS_DIV[:,1]
+
+# Calibration files are shared by every Si570 in the process (one per card)
+_calFileLock = threading.Lock()
+
+FDCO_MIN = 4850
+FDCO_MAX = 5670
+
+ADDR_SIZE = 4
+
+# Registers 7-12 hold HS_DIV, N1 and RFREQ
+CONFIG_REG   = 7
+CONFIG_WORDS = 6
+
+HS_DIV_CODE = {4: 0, 5: 1, 6: 2, 7: 3, 9: 5, 11: 7}
+HS_DIV_VALUE = {v: k for k, v in HS_DIV_CODE.items()}
+
+def si570DecodeConfig(regs):
+    # (N1, HS_DIV, RFREQ) from the contents of registers 7-12
+    n1_raw = ((regs[0] & 0x1f) << 2) | ((regs[1] & 0xc0) >> 6)
+    rfreq_raw = 0
+    for r in regs[1:]:
+        rfreq_raw = rfreq_raw << 8 | (r & 0xff)
+    rfreq_raw &= 0x1fffffffff
+    return n1_raw + 1, HS_DIV_VALUE[regs[0] >> 5], rfreq_raw / 2**28
+
+def si570EncodeConfig(n1, hs_div, rfreq):
+    n1_raw = n1 - 1
+    rfreq_raw = int(rfreq * 2**28) & 0x1fffffffff
+    return [(HS_DIV_CODE[hs_div] << 5) | ((n1_raw & 0x7c) >> 2),
+            ((n1_raw & 0x3) << 6) | (rfreq_raw >> 32)] + \
+           [(rfreq_raw >> s) & 0xff for s in (24, 16, 8, 0)]
+
+def si570Dividers(f1):
+    # First candidate that puts the DCO in range for an output of f1 MHz
+    ok = (N1_HS_DIV_PRODUCT > FDCO_MIN/f1) & (N1_HS_DIV_PRODUCT < FDCO_MAX/f1)
+    if not ok.any():
+        raise ValueError(f'Si570 cannot produce {f1} MHz')
+    n1, hs_div = N1_HS_DIV[ok.argmax()]
+    return int(n1), int(hs_div)
+
 class Si570(pr.Device):
-    def __init__(self, factory_freq, **kwargs):
+    def __init__(self, factory_freq, calFile='~/.l2si_drp/si570.json', **kwargs):
         super().__init__(**kwargs)
         self.factory_freq = factory_freq
 
-        ADDR_SIZE = 4
+        # fxtal is fixed per part: calibrate once and cache it per board
+        # (boardId, e.g. the FPGA DNA, set by the owner) in calFile
+        self.boardId  = None
+        self._calFile = os.path.expanduser(calFile) if calFile else None
+        self._calLock = threading.Lock()
+        self._fxtal   = None
+
+        # Registers 7-12 as last read or written in one burst
+        self._shadow  = None
 
         for i in range(7, 13):
             self.add(pr.RemoteVariable(
@@ -39,20 +97,14 @@ class Si570(pr.Device):
 
         # Extract N1 register value
         def n1_raw_get(read):
-            high = self.Config[7].get(read=read)
-            low = self.Config[8].get(read=read)
-            return ((high & 0x1f) << 2) | ((low & 0xc0) >> 6)
+            regs = self.configRegs(read)
+            return ((regs[0] & 0x1f) << 2) | ((regs[1] & 0xc0) >> 6)
 
         def n1_raw_set(value, write):
-            high = self.Config[7].value() & 0xe0
-            low = self.Config[8].value() & 0x1f
-
-            high |= (value & 0b01111100) >> 2
-            low |= (value & 0x3) << 6
-
-            self.Config[7].set(high, write=False)
-            self.Config[8].set(low, write=False)
-            self.writeAndVerifyBlocks()
+            regs = self.configRegs(False)
+            regs[0] = (regs[0] & 0xe0) | ((value & 0b01111100) >> 2)
+            regs[1] = (regs[1] & 0x3f) | ((value & 0x3) << 6)
+            self.setConfigRegs(regs, write)
 
         self.add(pr.LinkVariable(
             name = 'N1_RAW',
@@ -90,31 +142,37 @@ class Si570(pr.Device):
         ))
 
         # Map enum to link variable for setting as int
+        def hs_div_get(read):
+            return HS_DIV_VALUE.get(self.configRegs(read)[0] >> 5)
+
+        def hs_div_set(value, write):
+            regs = self.configRegs(False)
+            regs[0] = (regs[0] & 0x1f) | (HS_DIV_CODE[value] << 5)
+            self.setConfigRegs(regs, write)
+
         self.add(pr.LinkVariable(
             name = 'HS_DIV_INT',
             description = 'Sets value for high speed divider that takes the DCO output fOSC as its clock input',
             hidden = True,
             dependencies = [self.HS_DIV],
-            linkedGet = lambda read: int(self.HS_DIV.getDisp(read=read)),
-            linkedSet = lambda value, write: self.HS_DIV.setDisp(str(value))))
+            linkedGet = hs_div_get,
+            linkedSet = hs_div_set))
 
         # Extract RFREQ from registers
         def rfreq_raw_get(read):
             ret = 0
-            for i in range(8, 13):
-                ret = ret << 8 | self.Config[i].get(read=read)
+            for r in self.configRegs(read)[1:]:
+                ret = ret << 8 | r
 
             ret &= 0x1fffffffff
             return ret
 
         def rfreq_raw_set(value, write):
-            tmp = value
-            for i in reversed(range(8, 13)):
-                if i == 8:
-                    old = self.Config[i].get(read=False)
-                    tmp = (tmp & 0x1f) | (old & 0xc0)
-                self.Config[i].set(tmp&0xFF, write=write)
-                tmp = tmp >> 8
+            regs = self.configRegs(False)
+            regs[1] = (regs[1] & 0xc0) | ((value >> 32) & 0x1f)
+            for i in range(2, 6):
+                regs[i] = (value >> (8*(5-i))) & 0xff
+            self.setConfigRegs(regs, write)
 
         self.add(pr.LinkVariable(
             name = 'RFREQ_RAW',
@@ -194,53 +252,152 @@ class Si570(pr.Device):
             value = 0.,
             function = self.set_freq))
 
+    def _access(self, func):
+        # Through the parent bus scheduler, so the mux is on the Si570
+        run = getattr(self.parent, 'run', None)
+        return run('SI570', func) if run is not None else func()
+
+    # Variable accesses from the tree (GUI, ReadAll, readVariables) complete
+    # with the mux held on the Si570
+    def readBlocks(self, **kwargs):
+        kwargs['checkEach'] = True
+        return self._access(lambda: super(Si570, self).readBlocks(**kwargs))
+
+    def writeBlocks(self, **kwargs):
+        kwargs['checkEach'] = True
+        return self._access(lambda: super(Si570, self).writeBlocks(**kwargs))
+
+    def verifyBlocks(self, **kwargs):
+        kwargs['checkEach'] = True
+        return self._access(lambda: super(Si570, self).verifyBlocks(**kwargs))
+
+    def _updateShadow(self, regs):
+        # Keep the Config[] variables and the burst shadow in agreement
+        self._shadow = [int(r) & 0xff for r in regs]
+        for i,r in enumerate(self._shadow):
+            self.Config[CONFIG_REG+i].set(r, write=False)
+
+    def readShadow(self):
+        # Registers 7-12 in a single transaction
+        self._updateShadow(self._access(
+            lambda: self._rawRead(offset=CONFIG_REG*ADDR_SIZE, numWords=CONFIG_WORDS)))
+        return self._shadow
+
+    def writeShadow(self, regs=None):
+        regs = self._shadow if regs is None else regs
+        self._access(lambda: self._rawWrite(offset=CONFIG_REG*ADDR_SIZE, data=[int(r) for r in regs]))
+        self._updateShadow(regs)
+
+    def getShadow(self, read=True):
+        # None until registers 7-12 have been read or written
+        if read:
+            self.readShadow()
+        return None if self._shadow is None else list(self._shadow)
+
+    def configRegs(self, read=True):
+        # Registers 7-12 as held by the Config[] variables
+        if read:
+            self.readShadow()
+        return [int(self.Config[i].value()) for i in range(CONFIG_REG, CONFIG_REG+CONFIG_WORDS)]
+
+    def setConfigRegs(self, regs, write=True):
+        if write:
+            self.writeShadow(regs)
+        else:
+            self._updateShadow(regs)
+
+    def getConfig(self, read=True):
+        # (N1, HS_DIV, RFREQ)
+        regs = self.getShadow(read)
+        if regs is None:
+            raise RuntimeError(f'{self.path}: configuration not read yet')
+        return si570DecodeConfig(regs)
+
+    def writeConfig(self, n1, hs_div, rfreq):
+        self.writeShadow(si570EncodeConfig(n1, hs_div, rfreq))
+
+    def getFrequency(self, read=True):
+        # Output frequency (MHz) implied by the current configuration, None
+        # while fxtal is unknown (calibrate() or set_freq establish it)
+        fxtal = self.fxtal(calibrate=False)
+        if fxtal is None:
+            return None
+        n1, hs_div, rfreq = self.getConfig(read)
+        return fxtal * rfreq / (hs_div * n1)
+
+    def _loadCal(self):
+        try:
+            with open(self._calFile) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _saveCal(self, fxtal):
+        # Merge this board's entry and replace the file atomically
+        with _calFileLock:
+            cal = self._loadCal()
+            cal[str(self.boardId)] = fxtal
+            d = os.path.dirname(self._calFile)
+            os.makedirs(d, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=d, prefix='.si570', suffix='.json')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(cal, f, indent=2)
+                os.replace(tmp, self._calFile)
+            except BaseException:
+                os.unlink(tmp)
+                raise
+
+    def calibrate(self):
+        # Recall the factory configuration and derive fxtal from it
+        def recall():
+            self.RECALL()
+            v = 1
+            while (v&1):
+                time.sleep(1.e-3)
+                v = self.RST_REG.get()
+            return self.getConfig(read=True)
+
+        n1, hs_div, rfreq = self._access(recall)
+        if rfreq == 0:
+            raise RuntimeError(f'{self.path}: RFREQ reads back zero after RECALL')
+        fxtal = self.factory_freq * hs_div * n1 / rfreq
+
+        if self._calFile is not None and self.boardId is not None:
+            self._saveCal(fxtal)
+
+        self._fxtal = fxtal
+        return fxtal
+
+    def fxtal(self, calibrate=True):
+        # Cached or stored value; otherwise calibrate (RECALL, which retunes
+        # the output to the factory frequency) or None if calibrate is unset
+        with self._calLock:
+            if self._fxtal is None and self._calFile is not None and self.boardId is not None:
+                self._fxtal = self._loadCal().get(str(self.boardId))
+            if self._fxtal is None and calibrate:
+                self.calibrate()
+            return self._fxtal
+
     def set_freq(self, dev, cmd, arg):
+        # Whole procedure with the mux held on the Si570
+        self._access(lambda: self._setFreq(arg))
 
-        value = arg
-        write = True
-
-        def get_fxtal(read):
-            rfreq =  self.RFREQ.get(read)
-            if rfreq == 0:
-                return 0.0
-            else:
-                return self.factory_freq * self.HS_DIV_INT.get(read=read) * self.N1.get(read=read) / rfreq
-
-        n1_array = [1] + [x for x in range(2, 2**7, 2)]
-        hs_div_array = [11, 9, 7, 6, 5, 4]
-
-        def find_params(f1):
-            # want low N1 and high HS_DIV
-            for n1 in n1_array:
-                for hs_div in hs_div_array:
-                    fdco = f1 * hs_div * n1
-                    if 4850 < fdco < 5670:
-                        return n1, hs_div
-
-        self.RECALL()
-        v = 1
-        while (v&1):
-            time.sleep(1.e-3)
-            v = self.RST_REG.get()
+    def _setFreq(self, value):
+        # No RECALL once fxtal is known; the new configuration is written
+        # in full so the current register state does not matter
+        n1, hs_div = si570Dividers(value)
+        rfreq = value * hs_div * n1 / self.fxtal()
 
         with self.root.updateGroup():
-            n1, hs_div = find_params(value)
-            fdco = value * hs_div * n1
-            rfreq = fdco / get_fxtal(read=True)
-
             # Freeze
             self.FreezeDCO.set(1, write=True)
 
-            # Write new config
-            self.N1.set(n1, write=False)
-            self.HS_DIV_INT.set(hs_div, write=False)
-            self.RFREQ.set(rfreq, write=False)
-            self.writeAndVerifyBlocks()
+            # Write new config, registers 7-12 in one burst
+            self.writeConfig(n1, hs_div, rfreq)
 
             # Unfreeze
             self.FreezeDCO.set(0, write=True)
 
             # NewFreq
             self.NewFreq()
-
-
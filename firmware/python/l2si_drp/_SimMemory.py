@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+#
+#  Behavioral stand-in for the /dev/datadev AxiMemMap.  Implements the
+#  DevKcu1500 address map as sparse 32-bit word storage plus a handful of
+#  time-evolving registers (clock counters, DMA indices, overflow counters)
+#  and the I2CBus mux.  Unmodeled addresses behave as plain RAM.
+#
+
+import math
+import threading
+import time
+
+import rogue.interfaces.memory as rim
+
+AXI_VERSION_BASE   = 0x0002_0000
+MIG_DMA_BASE       = 0x0080_0000
+TDET_SEMI_BASE     = 0x00A0_0000
+PGP_MISC_BASE      = 0x00A4_0000
+TDET_TIMING_BASE   = 0x00C0_0000
+I2C_BUS_BASE       = 0x00E0_0000
+
+# I2CBus.select targets
+I2C_QSFP1          = 0x02
+I2C_SI570          = 0x04
+I2C_FAN            = 0x08
+I2C_QSFP0          = 0x10
+I2C_EEPROM         = 0x20
+
+class SimMemory(rim.Slave):
+    def __init__(self,
+                 tdet        = True,    # MigToPcieDma (True) or MigIlvToPcieDma (False)
+                 numLanes    = 4,
+                 blockSize   = 21,
+                 latency     = 0.0,     # seconds per PCIe transaction
+                 i2cLatency  = 0.0,     # seconds per I2C register (byte) access
+                 blockRate   = 1000.,   # DMA blocks/s written per lane
+                 backlog     = 4,       # blocks between write and read index
+                 oflowRate   = 0.,      # overflow counter increments/s
+                 monClkRates = (250.e6, 156.25e6, 185.714e6, 300.e6),
+                 timingClk   = 185.714e6,
+                 frameRate   = 928571.,
+                 si570Freq   = 156.25,
+                 si570Fxtal  = 114.285):
+        rim.Slave.__init__(self, 4, 0x1000)
+
+        self.latency     = latency
+        self.i2cLatency  = i2cLatency
+        self.blockRate   = blockRate
+        self.backlog     = backlog
+        self.oflowRate   = oflowRate
+        self.monClkRates = list(monClkRates)
+        self.timingClk   = timingClk
+        self.frameRate   = frameRate
+
+        self._tdet      = tdet
+        self._numLanes  = numLanes if tdet else 1
+        self._blockSize = blockSize
+        self._lock      = threading.Lock()
+        self._t0        = time.monotonic()
+        self._mem       = {}
+        self._select    = 0
+        self._i2c       = {t:{} for t in (I2C_QSFP0,I2C_QSFP1,I2C_SI570)}
+        self._migWindow = 32*self._numLanes if tdet else 0x24
+
+        self.stats = {'read':0, 'write':0, 'i2c':0, 'select':0, 'nack':0}
+
+        self._mem[AXI_VERSION_BASE+0x0] = 0x0400_0000
+        stamp = f'SimMemory: tdet={tdet} lanes={self._numLanes}'.encode()
+        for i in range(0, len(stamp), 4):
+            self._mem[AXI_VERSION_BASE+0x800+i] = int.from_bytes(stamp[i:i+4], 'little')
+        self._mem[PGP_MISC_BASE+0x20]   = 0x1
+
+        # Si570 non-volatile configuration and QSFP EEPROM contents
+        self._si570Nvm = self._si570Config(si570Freq, si570Fxtal)
+        self._i2c[I2C_SI570].update(self._si570Nvm)
+        for t in (I2C_QSFP0,I2C_QSFP1):
+            self._i2c[t].update(self._qsfpConfig())
+
+    @staticmethod
+    def _si570Config(freq, fxtal):
+        n1, hs_div = next((n1,hs) for n1 in [1]+list(range(2,2**7,2))
+                          for hs in [11,9,7,6,5,4] if 4850 < freq*hs*n1 < 5670)
+        rfreq  = int(freq*hs_div*n1/fxtal * 2**28)
+        n1raw  = n1-1
+        hscode = {4:0,5:1,6:2,7:3,9:5,11:7}[hs_div]
+        regs   = {7 : (hscode<<5) | (n1raw>>2),
+                  8 : ((n1raw&0x3)<<6) | ((rfreq>>32)&0x3f)}
+        for i in range(4):
+            regs[12-i] = (rfreq>>(8*i))&0xff
+        return regs
+
+    @staticmethod
+    def _qsfpConfig():
+        regs = {}
+        def u16(reg, v):
+            regs[reg]   = (v>>8)&0xff
+            regs[reg+1] = v&0xff
+        u16(22, 35*256)         # temperature, 1/256 C
+        u16(26, 33000)          # Vcc, 100 uV
+        for lane in range(4):
+            u16(34+2*lane, 5000)    # RX power, 0.1 uW
+            u16(42+2*lane, 3000)    # TX bias, 2 uA
+        for i,c in enumerate('SLAC            '):
+            regs[148+i] = ord(c)
+        for i,c in enumerate('250131  '):
+            regs[212+i] = ord(c)
+        regs[220] = 0x68
+        return regs
+
+    def _i2cAccess(self, addr):
+        # Return (register file, register) for an I2C window address or None
+        off = addr - I2C_BUS_BASE
+        if off < 0x400 or off >= 0x1000:
+            return None
+        self.stats['i2c'] += 1
+        targets = (I2C_SI570,) if off >= 0x800 else (I2C_QSFP0,I2C_QSFP1)
+        for t in targets:
+            if self._select & t:
+                return (self._i2c[t], (off & 0x3ff)>>2)
+        self.stats['nack'] += 1
+        return (None,0)
+
+    def _readWord(self, addr, t):
+        i2c = self._i2cAccess(addr)
+        if i2c is not None:
+            regs, reg = i2c
+            if regs is None:
+                return 0xff
+            if reg == 22:   # let the QSFP temperature wander a little
+                return (regs.get(22,0) + int(2*math.sin(t/60.)))&0xff
+            return regs.get(reg,0)
+
+        if addr == I2C_BUS_BASE:
+            return self._select
+
+        if addr == AXI_VERSION_BASE+0x8:
+            return int(t)&0xffffffff
+
+        if addr >= TDET_TIMING_BASE and addr < TDET_TIMING_BASE+0x100:
+            off = addr - TDET_TIMING_BASE
+            if off in (0x00,0x04):
+                return int(t*self.frameRate)&0xffffffff
+            if off in (0x10,0x28):
+                return int(t*self.timingClk/16)&0xffffffff
+            if off == 0x20:
+                return 0x2
+
+        if addr >= MIG_DMA_BASE+0x80 and addr < MIG_DMA_BASE+0x80+self._migWindow:
+            lane, off = divmod(addr-MIG_DMA_BASE-0x80, 32)
+            if not self._tdet:
+                lane, off = 0, addr-MIG_DMA_BASE-0x80
+            return self._migWord(lane, off, t)
+
+        if addr >= MIG_DMA_BASE+0x100 and addr < MIG_DMA_BASE+0x100+4*len(self.monClkRates):
+            rate = self.monClkRates[(addr-MIG_DMA_BASE-0x100)>>2]
+            return (int(rate*(1+1.e-6*math.sin(t)))&0x1fffffff) | (1<<31)
+
+        return self._mem.get(addr,0)
+
+    def _migWord(self, lane, off, t):
+        bits  = 30-self._blockSize
+        mask  = (1<<bits)-1
+        depth = 1<<(bits-1)
+        wr    = int(t*self.blockRate) + 3*lane
+        wc    = wr - 1
+        rd    = wc - self.backlog
+        oflow = int(t*self.oflowRate)
+        if off == 0x08:
+            return ((depth-(wr-rd))&mask) | (((wc-rd)&mask)<<12)
+        if off == 0x0c:
+            return (wr-wc)&mask
+        if off == 0x10:
+            return wr&mask
+        if off == 0x14:
+            return wc&mask
+        if off == 0x18:
+            return rd&mask
+        if off == 0x1c and not self._tdet:
+            return (oflow&0xff) | (((oflow>>1)&0xff)<<8)
+        if off == 0x20 and not self._tdet:
+            return int.from_bytes(bytes(((oflow>>(2+i))&0xff) for i in range(4)),'little')
+        return self._mem.get(MIG_DMA_BASE+0x80+32*lane+off,0)
+
+    def _writeWord(self, addr, value):
+        i2c = self._i2cAccess(addr)
+        if i2c is not None:
+            regs, reg = i2c
+            if regs is None:
+                return
+            if regs is self._i2c[I2C_SI570] and reg == 135:
+                if value & 0x1:
+                    regs.update(self._si570Nvm)
+                # RST_REG, NewFreq and RECALL self-clear
+                value &= ~0xc1
+            regs[reg] = value&0xff
+            return
+
+        if addr == I2C_BUS_BASE:
+            if value != self._select:
+                self.stats['select'] += 1
+            self._select = value&0xff
+            return
+
+        self._mem[addr] = value
+
+    def _doTransaction(self, transaction):
+        with self._lock:
+            addr = transaction.address()
+            size = transaction.size()
+            t    = time.monotonic()-self._t0
+
+            if transaction.type() == rim.Write or transaction.type() == rim.Post:
+                self.stats['write'] += 1
+                ba = bytearray(size)
+                transaction.getData(ba, 0)
+                for i in range(0, size, 4):
+                    self._writeWord(addr+i, int.from_bytes(ba[i:i+4],'little'))
+            else:
+                self.stats['read'] += 1
+                ba = bytearray(size)
+                for i in range(0, size, 4):
+                    ba[i:i+4] = self._readWord(addr+i, t).to_bytes(4,'little')[:size-i]
+                transaction.setData(ba, 0)
+
+            i2c = I2C_BUS_BASE+0x400 <= addr < I2C_BUS_BASE+0x1000
+            time.sleep(self.latency + (self.i2cLatency*((size+3)//4) if i2c else 0))
+            transaction.done()
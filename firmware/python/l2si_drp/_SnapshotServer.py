@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pyrogue as pr
+import pyrogue.interfaces
+import l2si_drp
+import json
+import logging
+import pickle
+import threading
+import time
+import zlib
+
+import numpy as np
+import zmq
+
+# Snapshot frame: header followed by one record of SnapshotLayout values
+SNAPSHOT_MAGIC   = b'L2SS'
+SNAPSHOT_VERSION = 1
+
+SnapshotHeader = np.dtype([
+    ('magic',   'S4'),
+    ('version', '<u2'),
+    ('count',   '<u2'),
+    ('layout',  '<u4'),   # crc32 of the layout description
+    ('seq',     '<u8'),
+    ('time',    '<f8'),   # unix time of the read
+])
+
+def snapshotLayout(variables):
+    # Record dtype for the numeric variables; others are not broadcast
+    fields = []
+    for v in variables:
+        value = v.value()
+        if isinstance(value, (bool, np.bool_)):
+            fields.append((v.path, '?'))
+        elif isinstance(value, (int, np.integer)):
+            fields.append((v.path, '<i8' if v.typeStr.startswith('Int') or value < 0 else '<u8'))
+        elif isinstance(value, (float, np.floating)):
+            fields.append((v.path, '<f8'))
+    return np.dtype(fields)
+
+def layoutId(layout):
+    return zlib.crc32(json.dumps(layout.descr).encode())
+
+def decodeSnapshot(frame, layout):
+    # (header, values) from a published frame, layout from the 'layout' topic
+    if isinstance(layout, (str, bytes)):
+        layout = np.dtype([tuple(f) for f in json.loads(layout)['descr']])
+    hdr = np.frombuffer(frame, dtype=SnapshotHeader, count=1)[0]
+    if hdr['magic'] != SNAPSHOT_MAGIC or hdr['version'] != SNAPSHOT_VERSION:
+        raise ValueError('Not a snapshot frame')
+    if hdr['layout'] != layoutId(layout):
+        raise ValueError('Snapshot layout mismatch')
+    return hdr, np.frombuffer(frame, dtype=layout, count=1, offset=SnapshotHeader.itemsize)[0]
+
+class SnapshotServer(pyrogue.interfaces.ZmqServer):
+    # ZmqServer that reads the monitored register set once per period and
+    # publishes it as a binary frame on its own PUB socket (topics 'snapshot'
+    # and, every layoutEvery frames, 'layout'); by default the set is the
+    # monitored variables outside the I2C bus.  Client get/getDisp requests
+    # are answered from the last read when it is younger than freshness;
+    # concurrent requests for a stale variable share one hardware read.
+    def __init__(self, *, root, addr, port, period=1.0, freshness=0.5,
+                 variables=None, snapshotPort=0, layoutEvery=10, **kwargs):
+        super().__init__(root=root, addr=addr, port=port, **kwargs)
+        self._period      = period
+        self._freshness   = freshness
+        self._variables   = variables
+        self._layoutEvery = layoutEvery
+        self._lock        = threading.Lock()
+        self._pathLocks   = {}
+        self._fresh       = {}
+        self._layout      = None
+        self._seq         = 0
+        self._thread      = None
+        self._stopped     = threading.Event()
+        self._log         = logging.getLogger(__name__)
+        self.served       = 0
+        self.reads        = 0
+
+        # PUB socket, opened in _start; a random port is kept across restarts
+        self._ctx          = zmq.Context.instance()
+        self._pub          = None
+        self._pubAddr      = addr
+        self._snapshotPort = snapshotPort
+        self.snapshotAddress = None
+
+    def _openPub(self):
+        self._pub = self._ctx.socket(zmq.PUB)
+        if self._snapshotPort:
+            self._pub.bind(f'tcp://{self._pubAddr}:{self._snapshotPort}')
+        else:
+            self._snapshotPort = self._pub.bind_to_random_port(f'tcp://{self._pubAddr}')
+        self.snapshotAddress = f'tcp://{self._pubAddr}:{self._snapshotPort}'
+
+    def layout(self):
+        if self._layout is None:
+            return None
+        return {'descr':self._layout.descr, 'layout':layoutId(self._layout), 'version':SNAPSHOT_VERSION}
+
+    def snapshot(self):
+        # Read the monitored set once and publish it
+        t = time.time()
+        l2si_drp.readVariables(self._root, self._variables)
+        now = time.monotonic()
+        with self._lock:
+            for v in self._variables:
+                self._fresh[v.path] = now
+            self.reads += 1
+            if self._layout is None:
+                self._layout = snapshotLayout(self._variables)
+            seq = self._seq
+            self._seq += 1
+
+        rec = np.zeros((), dtype=self._layout)
+        for v in self._variables:
+            if v.path in self._layout.fields:
+                rec[v.path] = v.value()
+        hdr = np.array((SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(self._layout.names),
+                        layoutId(self._layout), seq, t), dtype=SnapshotHeader)
+
+        if self._pub is not None:
+            if seq % self._layoutEvery == 0:
+                self._pub.send_multipart([b'layout', json.dumps(self.layout()).encode()])
+            self._pub.send_multipart([b'snapshot', hdr.tobytes()+rec.tobytes()])
+        return hdr, rec
+
+    def _read(self, node):
+        # Hardware read unless a read within the freshness window exists
+        with self._lock:
+            lock = self._pathLocks.setdefault(node.path, threading.Lock())
+        with lock:
+            if time.monotonic() - self._fresh.get(node.path, -np.inf) > self._freshness:
+                # Through readVariables so I2C mux devices are selected first
+                l2si_drp.readVariables(self._root, [node])
+                self._fresh[node.path] = time.monotonic()
+            else:
+                self.served += 1
+
+    def _doRequest(self, data):
+        try:
+            d = pickle.loads(data)
+            if d.get('path') == '__SNAPSHOT__':
+                return pickle.dumps(self.layout())
+            attr   = d.get('attr')
+            kwargs = d.get('kwargs', {})
+            if attr in ('get', 'getDisp') and kwargs.get('read', True) and not d.get('args'):
+                node = self._root.getNode(d.get('path'))
+                bus  = l2si_drp.i2cTarget(node.parent) if node is not None else None
+                # The shared QSFP window (no fixed mux target) takes the normal path
+                if isinstance(node, pr.RemoteVariable) and not isinstance(node, pr.BaseCommand) and \
+                   (bus is None or bus[1] is not None):
+                    self._read(node)
+                    index = kwargs.get('index', -1)
+                    if attr == 'get':
+                        return pickle.dumps(node.get(read=False, index=index))
+                    return pickle.dumps(node.getDisp(read=False, index=index))
+        except Exception as e:
+            return pickle.dumps(e)
+        return super()._doRequest(data)
+
+    def _run(self):
+        while not self._stopped.wait(self._period):
+            try:
+                self.snapshot()
+            except Exception as e:
+                self._log.warning(f'Snapshot failed: {e}')
+
+    def _start(self):
+        super()._start()
+        if self._variables is None:
+            # I2C devices stay on their POLL_PERIODS tier, not the snapshot period
+            self._variables = [v for v,p in l2si_drp.monitoredVariables(self._root)
+                               if not l2si_drp.behindMux(v.parent)]
+        self._openPub()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _stop(self):
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        if self._pub is not None:
+            self._pub.close()
+            self._pub = None
+        super()._stop()
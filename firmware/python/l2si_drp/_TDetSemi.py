@@ -10,6 +10,16 @@
 #-----------------------------------------------------------------------------
 import pyrogue as pr
 
+# Per lane configuration word at 4*lane
+LANE_LENGTH_MASK = (1<<23)-1
+LANE_CLEAR       = 1<<30
+LANE_ENABLE      = 1<<31
+LANE_RESERVED    = (LANE_CLEAR-1) & ~LANE_LENGTH_MASK    # bits 23-29, kept as read
+
+def tdetLaneWord(length, clear=False, enable=False, reserved=0):
+    return ((length & LANE_LENGTH_MASK) | (reserved & LANE_RESERVED) |
+            (LANE_CLEAR if clear else 0) | (LANE_ENABLE if enable else 0))
+
 class TDetSemi(pr.Device):
     def __init__(self,
                  name        = 'TDetSemi',
@@ -22,6 +32,8 @@ class TDetSemi(pr.Device):
             **kwargs
         )
 
+        self._numLanes = numLanes
+
         for i in range(numLanes):
 
             self.add(pr.RemoteVariable(
@@ -54,3 +66,56 @@ class TDetSemi(pr.Device):
             mode      = 'RO',
         ))
 
+
+    def readLanes(self):
+        # All lane words in one transaction
+        w = self._rawRead(offset=0, numWords=self._numLanes)
+        return list(w) if isinstance(w, (list, tuple)) else [w]
+
+    def writeLanes(self, words):
+        # All lane words in one ordered transaction.  The variable shadows
+        # are updated to match so later field writes do not restore old bits.
+        words = [int(w) for w in words]
+        self._rawWrite(offset=0, data=words)
+        for i,w in enumerate(words):
+            self.node(f'Length_{i}').set(w & LANE_LENGTH_MASK, write=False)
+            self.node(f'Clear_{i}' ).set(int(bool(w & LANE_CLEAR)), write=False)
+            self.node(f'Enable_{i}').set(int(bool(w & LANE_ENABLE)), write=False)
+        return words
+
+    def shadowLanes(self):
+        # Lane words from the Length/Clear/Enable variable shadows (no access)
+        return [tdetLaneWord(self.node(f'Length_{i}').value(),
+                             self.node(f'Clear_{i}' ).value(),
+                             self.node(f'Enable_{i}').value()) for i in range(self._numLanes)]
+
+    def configureLanes(self, lengths=None, enable=None, clear=None, read=True):
+        # lengths: one value for all lanes or one per lane; enable and clear
+        # are lane bit masks.  Fields left as None, and the reserved bits,
+        # keep their current value from one read of all lanes.  read=False
+        # takes them from the variable shadows instead (no reserved bits),
+        # only valid once the lanes have been read or written.  One write.
+        n   = self._numLanes
+        cur = self.readLanes() if read else self.shadowLanes()
+        if lengths is not None and not isinstance(lengths, (list, tuple)):
+            lengths = [lengths]*n
+
+        words = []
+        for i,w in enumerate(cur):
+            words.append(tdetLaneWord(
+                lengths[i]      if lengths is not None else w,
+                clear  & (1<<i) if clear   is not None else w & LANE_CLEAR,
+                enable & (1<<i) if enable  is not None else w & LANE_ENABLE,
+                w))
+        return self.writeLanes(words)
+
+    def setEnableMask(self, mask):
+        return self.configureLanes(enable=mask)
+
+    def clearAll(self, hold=False):
+        # Assert clear on every lane in one write, then release it in a
+        # second write unless hold is set
+        words = self.configureLanes(clear=(1<<self._numLanes)-1)
+        if not hold:
+            words = self.writeLanes([w & ~LANE_CLEAR for w in words])
+        return words
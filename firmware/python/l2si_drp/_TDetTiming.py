@@ -42,7 +42,20 @@ class TDetTiming(pr.Device):
             numDetectors = numLanes,
         ))
 
+        self._clkRates = None
+
+    def addClkRates(self, mon):
+        self._clkRates = mon
+        mon.addCounter(self.TimingFrameRx.RxClkCount)
+        mon.addCounter(self.TimingFrameRx.TxClkCount)
+
     def refClockRate(self):
+        # Use the background estimate when one is available
+        if self._clkRates is not None:
+            rate, err = self._clkRates.rate(self.TimingFrameRx.TxClkCount)
+            if rate is not None:
+                return rate
+
         tvb = time.perf_counter()
         vvb = self.TimingFrameRx.TxClkCount.get()
         time.sleep(0.1)
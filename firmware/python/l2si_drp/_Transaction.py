@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+#-----------------------------------------------------------------------------
+# This file is part of the LCLS2 PGP Firmware Library'. It is subject to
+# the license terms in the LICENSE.txt file found in the top-level directory
+# of this distribution and at:
+#    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+# No part of the LCLS2 PGP Firmware Library', including this file, may be
+# copied, modified, propagated, or distributed except according to the terms
+# contained in the LICENSE.txt file.
+#-----------------------------------------------------------------------------
+import pyrogue as pr
+import l2si_drp
+import collections
+
+def writeVariables(root, values, verify=True):
+    # values: {variable:value}.  All values go into the variable shadows
+    # first, so fields sharing a word are merged, then one write is issued
+    # per distinct field layout (a variable-scoped transaction only covers
+    # that variable's bytes) in address order, verified in one pass and
+    # checked once per block.  Returns [(path, error)] for the blocks that
+    # failed; their shadows (or all of them if the write itself raises) are
+    # put back to the old values, the hardware is not.  Only remote
+    # variables can be merged this way.
+    for v in values:
+        if not isinstance(v, pr.RemoteVariable):
+            raise TypeError(f'{v.path} is not a remote variable, set it directly')
+
+    blocks = l2si_drp.blockVariables(values)
+    ranges = collections.OrderedDict()
+    for vs in blocks.values():
+        for v in vs:
+            ranges.setdefault((id(getattr(v, '_block', v)), v.offset, repr(v.bitOffset), repr(v.bitSize)), v)
+    old    = {v:v.value() for v in values}
+
+    def restore(vs):
+        for v in vs:
+            v.set(old[v], write=False)
+
+    try:
+        for v,value in values.items():
+            v.set(value, write=False)
+
+        errors = []
+        with root.updateGroup():
+            for v in ranges.values():
+                v.parent.writeBlocks(force=True, recurse=False, variable=v)
+            if verify:
+                for v in ranges.values():
+                    v.parent.verifyBlocks(recurse=False, variable=v)
+            for vs in blocks.values():
+                try:
+                    vs[0].parent.checkBlocks(recurse=False, variable=vs[0])
+                except Exception as e:
+                    errors.append((vs[0].path, f'{e} (shadows restored, the hardware may hold the new values)'))
+                    restore(vs)
+    except Exception:
+        restore(values)
+        raise
+    return errors
+
+class RegisterTransaction(object):
+    # Collects writes to any devices under root and applies them together
+    # with writeVariables() when the context exits without an exception.
+    # Later writes to the same variable replace earlier ones.
+    def __init__(self, root, verify=True, raiseOnError=True):
+        self._root   = root
+        self._verify = verify
+        self._raise  = raiseOnError
+        self._values = collections.OrderedDict()
+        self.errors  = []
+
+    def _node(self, var):
+        if not isinstance(var, str):
+            return var
+        if not var.startswith(self._root.name + '.'):
+            var = f'{self._root.name}.{var}'
+        node = self._root.getNode(var)
+        if node is None:
+            raise KeyError(f'No variable {var}')
+        return node
+
+    def set(self, var, value):
+        # var: variable or path (with or without the root name)
+        self._values[self._node(var)] = value
+
+    def commit(self):
+        values, self._values = self._values, collections.OrderedDict()
+        self.errors = writeVariables(self._root, values, self._verify) if values else []
+        if self.errors and self._raise:
+            raise RuntimeError('Register transaction failed:\n' +
+                               '\n'.join(f'  {path}: {err}' for path,err in self.errors))
+        return self.errors
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self._values.clear()
+        return False
@@ -1,11 +1,26 @@
 #!/usr/bin/env python
 
 from l2si_drp._Root             import *
+from l2si_drp._AxisHistogram    import *
+from l2si_drp._ClkRateMonitor   import *
 from l2si_drp._PcieControl      import *
 from l2si_drp._DevKcu1500       import *
+from l2si_drp._DmaQualification import *
+from l2si_drp._DmaReceiver      import *
+from l2si_drp._EventTiming      import *
 from l2si_drp._I2CBus           import *
+from l2si_drp._I2cScheduler     import *
+from l2si_drp._MemPath          import *
+from l2si_drp._MetricsExporter  import *
+from l2si_drp._MigStatus        import *
+from l2si_drp._MigTelemetry     import *
 from l2si_drp._MigIlvToPcieDma  import *
 from l2si_drp._MigToPcieDma     import *
+from l2si_drp._PollScheduler    import *
+from l2si_drp._RegisterMap      import *
 from l2si_drp._Si570            import *
+from l2si_drp._SimMemory        import *
+from l2si_drp._SnapshotServer   import *
 from l2si_drp._TDetSemi         import *
 from l2si_drp._TDetTiming       import *
+from l2si_drp._Transaction      import *
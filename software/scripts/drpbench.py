@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'PGP PCIe APP DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'PGP PCIe APP DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import l2si_drp
+import pyrogue as pr
+import rogue.interfaces.stream as ris
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--dev",
+    type     = str,
+    required = False,
+    default  = 'sim',
+    help     = "path to device (sim = behavioral register model)",
+)
+
+parser.add_argument(
+    "--repeat",
+    type     = int,
+    required = False,
+    default  = 3,
+    help     = "repetitions per measurement",
+)
+
+parser.add_argument(
+    "--iterations",
+    type     = int,
+    required = False,
+    default  = 1000,
+    help     = "accesses per latency measurement",
+)
+
+parser.add_argument(
+    "--latency",
+    type     = float,
+    required = False,
+    default  = 0.,
+    help     = "sim: seconds per PCIe transaction",
+)
+
+parser.add_argument(
+    "--i2cLatency",
+    type     = float,
+    required = False,
+    default  = 0.,
+    help     = "sim: seconds per I2C register access",
+)
+
+parser.add_argument(
+    "--top",
+    type     = str,
+    required = False,
+    default  = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../firmware/common/python'),
+    help     = "directory holding the DrpTDet package (Top.py helpers)",
+)
+
+parser.add_argument(
+    "--json",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "write the results to this file",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+roots = {
+    'DrpTDet'    : l2si_drp.DrpTDetRoot,
+    'DrpTDetGpu' : l2si_drp.DrpTDetGpuRoot,
+    'DrpPgpIlv'  : l2si_drp.DrpPgpIlvRoot,
+}
+
+# Full tree versus the subtrees a typical control script touches
+selections = {
+    'all'     : None,
+    'minimal' : ['MigToPcieDma','MigIlvToPcieDma','TDetSemi'],
+}
+
+results = []
+
+def record(name, times, unit='s', **tags):
+    # Summary of a list of samples; one entry per measurement
+    t = np.asarray(times, dtype=np.float64)
+    r = {'name':name, 'unit':unit, 'n':len(t), 'min':t.min(), 'median':np.median(t),
+         'mean':t.mean(), 'p99':np.percentile(t, 99), **tags}
+    results.append(r)
+    desc = ' '.join(f'{k}={v}' for k,v in tags.items())
+    print(f'{name:20s} {desc:36s} min {r["min"]:.3e} median {r["median"]:.3e} p99 {r["p99"]:.3e} {unit}')
+
+def memMap(tdet=True):
+    # None lets PcieControl open the device
+    if args.dev != 'sim':
+        return None
+    return l2si_drp.SimMemory(tdet=tdet, latency=args.latency, i2cLatency=args.i2cLatency)
+
+def tdetOf(root):
+    return root != 'DrpPgpIlv'
+
+def timeit(func, n):
+    t = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        func()
+        t[i] = time.perf_counter()-t0
+    return t
+
+#################################################################
+# Import
+
+def benchImport():
+    cmd = 'import time; t=time.perf_counter(); import l2si_drp; print(time.perf_counter()-t)'
+    t = [float(subprocess.check_output([sys.executable, '-c', cmd])) for i in range(args.repeat)]
+    record('import', t, module='l2si_drp')
+
+#################################################################
+# Construction, start (ReadAll or tiered initial read)
+
+def benchStartup(root, sel, devices, initRead):
+    tcons  = []
+    tstart = []
+    for i in range(args.repeat):
+        t0 = time.perf_counter()
+        r  = roots[root](pollEn=False, devname=args.dev, devices=devices,
+                         initRead=initRead, memMap=memMap(tdetOf(root)))
+        t1 = time.perf_counter()
+        r.start()
+        t2 = time.perf_counter()
+        r.stop()
+        tcons .append(t1-t0)
+        tstart.append(t2-t1)
+    if initRead == 'all':
+        record('construct', tcons, root=root, devices=sel)
+    record('start', tstart, root=root, devices=sel, initRead=initRead)
+
+#################################################################
+# Single variable access
+
+def benchAccess():
+    with l2si_drp.DrpTDetRoot(pollEn=False, devname=args.dev, initRead=None, memMap=memMap()) as root:
+        dev     = root.PcieControl.DevKcu1500
+        scratch = dev.AxiPcieCore.AxiVersion.ScratchPad
+        index   = dev.MigToPcieDma.Channel[0].WriteIndex
+        record('get', timeit(lambda: scratch.get(read=True), args.iterations), variable='ScratchPad')
+        record('set', timeit(lambda: scratch.set(0x5a5a, write=True), args.iterations), variable='ScratchPad')
+        record('get', timeit(lambda: index.get(read=True), args.iterations), variable='WriteIndex')
+        record('getStatus', timeit(dev.MigToPcieDma.getStatus, args.iterations), device='MigToPcieDma')
+        record('getQsfpDiag', timeit(dev.I2CBus.getQsfpDiagnostics, max(1, args.iterations//100)), device='I2CBus')
+
+#################################################################
+# Block decoding, reported in decoded records/s
+
+def rate(func, samples):
+    t = timeit(func, args.repeat)
+    return samples/t
+
+def benchDecode():
+    rng = np.random.default_rng(0)
+    n   = 100000
+
+    # n reads of 4 lanes each, reported as decoded lane rows
+    words = rng.integers(0, 1<<32, size=(n, 4*l2si_drp.MIG_CHANNEL_WORDS), dtype=np.uint32)
+    record('decodeMigStatus', rate(lambda: l2si_drp.decodeMigStatus(words), 4*n), unit='rows/s')
+
+    tmpVcc = rng.integers(0, 256, size=6,  dtype=np.uint32)
+    rxTx   = rng.integers(0, 256, size=16, dtype=np.uint32)
+    record('decodeQsfpDiag', rate(lambda: [l2si_drp.decodeQsfpDiag(tmpVcc, rxTx) for i in range(1000)], 1000), unit='1/s')
+
+    rmap  = l2si_drp.buildRegisterMap(l2si_drp.PcieControl(devname='sim'), 'DrpTDet', '')
+    block = rmap.blocksFor('PcieControl.DevKcu1500.MigToPcieDma.Channel')[0]
+    words = rng.integers(0, 1<<32, size=(n, block['words']), dtype=np.uint32)
+    record('RegisterMap.decode', rate(lambda: rmap.decode(block['address'], words, block['variables']), n), unit='1/s')
+
+#################################################################
+# DMA receive stage, frames/s through the null sink and a copying consumer
+
+def benchRx():
+    for consumer in (None, lambda f: f.array()):
+        for size in (64, 4096, 65536):
+            rx  = l2si_drp.DmaReceiver(0, maxBytes=args.iterations*size, consumer=consumer)
+            src = ris.Master()
+            src >> rx
+            rx.start()
+            data = bytearray(size)
+            t0 = time.perf_counter()
+            for i in range(args.iterations):
+                frame = src._reqFrame(size, True)
+                frame.write(data, 0)
+                src._sendFrame(frame)
+            while rx.consumed + rx.drops < args.iterations and consumer is not None:
+                time.sleep(1.e-3)
+            dt = time.perf_counter()-t0
+            rx.stop()
+            record('DmaReceiver', [args.iterations/dt], unit='1/s',
+                   sink='null' if consumer is None else 'array', size=size)
+
+#################################################################
+# DrpTDet/Top.py helpers
+
+def benchTop():
+    sys.path.insert(0, os.path.abspath(args.top))
+    try:
+        import DrpTDet.Top as top
+    except ImportError as e:
+        print(f'DrpTDet.Top skipped: {e}')
+        return
+
+    rng   = np.random.default_rng(0)
+    block = int.from_bytes(rng.integers(0, 256, size=32, dtype=np.uint8).tobytes(), 'little')
+    record('QSFPMonitor._u16', rate(lambda: [top.QSFPMonitor._u16(block, 8) for i in range(1000)], 1000), unit='1/s')
+
+    if args.dev != 'sim':
+        return
+
+    class TopRoot(pr.Root):
+        def __init__(self):
+            pr.Root.__init__(self, name='DrpTDetTop', pollEn=False)
+            self.add(top.Top(memBase=memMap()))
+
+    with TopRoot() as root:
+        record('getRTT', timeit(root.KCU.TDetSemi.getRTT, args.iterations), device='Top')
+        record('getDiagnostics', timeit(root.KCU.I2cBus.getDiagnostics, max(1, args.iterations//100)), device='Top')
+
+#################################################################
+
+benchImport()
+for root in roots:
+    for sel,devices in selections.items():
+        for initRead in ('all','tiered'):
+            benchStartup(root, sel, devices, initRead)
+benchAccess()
+benchDecode()
+benchRx()
+benchTop()
+
+if args.json:
+    meta = {
+        'time'       : time.time(),
+        'host'       : platform.node(),
+        'python'     : platform.python_version(),
+        'numpy'      : np.__version__,
+        'dev'        : args.dev,
+        'latency'    : args.latency,
+        'i2cLatency' : args.i2cLatency,
+        'repeat'     : args.repeat,
+        'iterations' : args.iterations,
+    }
+    with open(args.json, 'w') as f:
+        json.dump({'meta':meta, 'results':results}, f, indent=2, default=float)
+
+#################################################################
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'PGP PCIe APP DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'PGP PCIe APP DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import sys
+import argparse
+
+import l2si_drp
+import pyrogue.pydm
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Convert str to bool
+argBool = lambda s: s.lower() in ['true', 't', 'yes', '1']
+
+# Add arguments
+parser.add_argument(
+    "--dev",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated device paths (default all /dev/datadev_N or /dev/datagpu_N; sim = behavioral register model)",
+)
+
+parser.add_argument(
+    "--gpu",
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "GPU firmware variant",
+)
+
+parser.add_argument(
+    "--tdet",
+    type     = argBool,
+    required = False,
+    default  = True,
+    help     = "timing detector firmware variant (false for PgpIlv)",
+)
+
+parser.add_argument(
+    "--devices",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated DevKcu1500 subtrees to build (default all)",
+)
+
+parser.add_argument(
+    "--poll",
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "poll status at per device class rates",
+)
+
+parser.add_argument(
+    "--snapshot",
+    type     = float,
+    required = False,
+    default  = 0,
+    help     = "serve clients from a register snapshot read every N seconds (0 = off)",
+)
+
+parser.add_argument(
+    "--metricsPort",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "serve OpenMetrics card health on this localhost port (0 = any free port)",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+devnames = args.dev.split(',') if args.dev else None
+devices  = args.devices.split(',') if args.devices else None
+
+with l2si_drp.MultiCardRoot(pollEn=False, devnames=devnames, gpu=args.gpu,
+                            tdet=args.tdet, devices=devices, pollPeriods=args.poll,
+                            snapshotPeriod=args.snapshot, metricsPort=args.metricsPort) as root:
+     for card in root.cards:
+         print(f'{card.name} {card.devname}: ReadAll {root.cardTiming[card.name].get("readAll",0):.3f} s')
+     if root.metrics is not None:
+         print(f'Metrics at {root.metrics.address}')
+     pyrogue.pydm.runPyDM(serverList = root.zmqServer.address)
+
+#################################################################
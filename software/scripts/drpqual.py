@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'PGP PCIe APP DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'PGP PCIe APP DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import argparse
+import json
+import platform
+import sys
+import time
+
+import l2si_drp
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--dev",
+    type     = str,
+    required = False,
+    default  = '/dev/datadev_1',
+    help     = "path to device",
+)
+
+parser.add_argument(
+    "--lanes",
+    type     = str,
+    required = False,
+    default  = '0,1,2,3',
+    help     = "comma separated TDetSemi/DMA lanes",
+)
+
+parser.add_argument(
+    "--duration",
+    type     = float,
+    required = False,
+    default  = 60.,
+    help     = "seconds of triggers to consume",
+)
+
+parser.add_argument(
+    "--length",
+    type     = int,
+    required = False,
+    default  = 1024,
+    help     = "payload words per event",
+)
+
+parser.add_argument(
+    "--queueMB",
+    type     = int,
+    required = False,
+    default  = 256,
+    help     = "host receive queue bound per lane (MiB of payload)",
+)
+
+parser.add_argument(
+    "--json",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "write the report to this file",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+lanes = [int(lane) for lane in args.lanes.split(',')]
+
+with l2si_drp.DrpTDetRoot(pollEn=False, devname=args.dev, devices=['TDetSemi'], initRead=None) as root:
+    dev    = root.PcieControl.DevKcu1500
+    qual   = l2si_drp.DmaQualification(args.dev, tdetSemi=dev.TDetSemi, lanes=lanes, maxBytes=args.queueMB<<20)
+    report = qual.run(duration=args.duration, length=args.length)
+    build  = l2si_drp.readBuildStamp(root.PcieControl._dataMap)
+
+passed = True
+for lane,r in report.items():
+    ok = r['events'] > 0 and r['lost'] == 0 and r['repeats'] == 0 and r['backwards'] == 0 and r['drops'] == 0
+    passed &= ok
+    print(f'Lane {lane}: {r["events"]} events {r["framesPerSec"]:.1f} Hz {r["bytesPerSec"]/1.e6:.1f} MB/s '
+          f'lost {r["lost"]} repeats {r["repeats"]} backwards {r["backwards"]} drops {r["drops"]} '
+          f'latency p50 {r["latencyP50"] or 0:.2e} p99 {r["latencyP99"] or 0:.2e} s  {"PASS" if ok else "FAIL"}')
+
+if args.json:
+    meta = {
+        'time'     : time.time(),
+        'host'     : platform.node(),
+        'dev'      : args.dev,
+        'build'    : build,
+        'duration' : args.duration,
+        'length'   : args.length,
+        'passed'   : passed,
+    }
+    with open(args.json, 'w') as f:
+        json.dump({'meta':meta, 'lanes':report}, f, indent=2)
+
+sys.exit(0 if passed else 1)
+
+#################################################################
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'PGP PCIe APP DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'PGP PCIe APP DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import argparse
+
+import l2si_drp
+import rogue.hardware.axi
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--dev",
+    type     = str,
+    required = False,
+    default  = '/dev/datadev_0',
+    help     = "path to device (sim = behavioral register model)",
+)
+
+parser.add_argument(
+    "--variant",
+    type     = str,
+    required = False,
+    default  = 'DrpTDet',
+    choices  = list(l2si_drp.VARIANTS),
+    help     = "root variant of the firmware",
+)
+
+parser.add_argument(
+    "--devices",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated DevKcu1500 subtrees the root builds (default all)",
+)
+
+parser.add_argument(
+    "--prefix",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "read and print the variables under this path (e.g. PcieControl.DevKcu1500.MigToPcieDma)",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+if args.dev == 'sim':
+    memMap = l2si_drp.SimMemory(tdet=l2si_drp.VARIANTS[args.variant]['tdet'])
+else:
+    memMap = rogue.hardware.axi.AxiMemMap(args.dev)
+
+devices = args.devices.split(',') if args.devices else None
+
+rmap = l2si_drp.registerMap(args.variant, memMap, devices=devices)
+print(f'{rmap.variant}: {rmap.buildStamp}')
+print(f'{len(rmap.variables)} variables in {len(rmap.blocks)} blocks')
+print(l2si_drp.registerMapFile(args.variant, rmap.buildStamp, devices=devices))
+
+if args.prefix:
+    for path,value in sorted(rmap.read(memMap, rmap.blocksFor(args.prefix)).items()):
+        print(f'{path:64s} {value:#x}')
+
+#################################################################
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+##############################################################################
+## This file is part of 'PGP PCIe APP DEV'.
+## It is subject to the license terms in the LICENSE.txt file found in the
+## top-level directory of this distribution and at:
+##    https://confluence.slac.stanford.edu/display/ppareg/LICENSE.html.
+## No part of 'PGP PCIe APP DEV', including this file,
+## may be copied, modified, propagated, or distributed except according to
+## the terms contained in the LICENSE.txt file.
+##############################################################################
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import l2si_drp
+import pyrogue as pr
+
+#################################################################
+
+# Set the argument parser
+parser = argparse.ArgumentParser()
+
+# Add arguments
+parser.add_argument(
+    "--dev",
+    type     = str,
+    required = False,
+    default  = '/dev/datadev_1',
+    help     = "path to device",
+)
+
+parser.add_argument(
+    "--period",
+    type     = float,
+    required = False,
+    default  = 0.1,
+    help     = "RTT sample period (s)",
+)
+
+parser.add_argument(
+    "--report",
+    type     = float,
+    required = False,
+    default  = 10.,
+    help     = "print per lane statistics over the last N seconds, every N seconds",
+)
+
+parser.add_argument(
+    "--fullToTrig",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "alarm when fullToTrig exceeds this",
+)
+
+parser.add_argument(
+    "--nfullToTrig",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "alarm when nfullToTrig exceeds this",
+)
+
+parser.add_argument(
+    "--top",
+    type     = str,
+    required = False,
+    default  = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../firmware/common/python'),
+    help     = "directory holding the DrpTDet package",
+)
+
+# Get the arguments
+args = parser.parse_args()
+
+#################################################################
+
+sys.path.insert(0, os.path.abspath(args.top))
+import DrpTDet.Top as top
+
+logging.basicConfig(level=logging.WARNING)
+
+thresholds = {f:getattr(args, f) for f in top.RttMonitor.FIELDS if getattr(args, f) is not None}
+
+class RttRoot(pr.Root):
+    def __init__(self):
+        pr.Root.__init__(self, name='DrpTDetRtt', pollEn=False)
+        self.memMap = l2si_drp.openMemMap(args.dev, l2si_drp.selectMemPath(args.dev))
+        self.add(top.Top(memBase=self.memMap, rttPeriod=args.period, rttThresholds=thresholds))
+
+with RttRoot() as root:
+    mon = root.KCU.rttMonitor
+    try:
+        while True:
+            time.sleep(args.report)
+            stats = mon.stats(seconds=args.report)
+            if stats is None:
+                continue
+            for f,s in stats.items():
+                print(f'{f:12s} n {s["n"]:6d}  ' +
+                      '  '.join(f'lane {lane}: {s["min"][lane]}/{s["mean"][lane]:.1f}/{s["max"][lane]} p99 {s[99][lane]:.0f}'
+                                for lane in range(4)))
+            print(f'alarms {mon.alarms.tolist()}')
+    except KeyboardInterrupt:
+        pass
+
+#################################################################
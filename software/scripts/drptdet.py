@@ -29,7 +29,63 @@ parser.add_argument(
     type     = str,
     required = False,
     default  = '/dev/datadev_0',
-    help     = "path to device",
+    help     = "path to device (sim = behavioral register model)",
+)
+
+parser.add_argument(
+    "--devices",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated DevKcu1500 subtrees to build (default all)",
+)
+
+parser.add_argument(
+    "--poll",
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "poll status at per device class rates",
+)
+
+parser.add_argument(
+    "--snapshot",
+    type     = float,
+    required = False,
+    default  = 0,
+    help     = "serve clients from a register snapshot read every N seconds (0 = off)",
+)
+
+parser.add_argument(
+    "--metricsPort",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "serve OpenMetrics card health on this localhost port (0 = any free port)",
+)
+
+parser.add_argument(
+    "--rxLanes",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated DMA lanes to receive, with RxFrameRate/RxByteRate/RxDrops (default none)",
+)
+
+parser.add_argument(
+    "--memPath",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "register and DMA path: direct, bridge (rogue TCP bridge on localhost:8000) or auto",
+)
+
+parser.add_argument(
+    "--histLane",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "DMA lane carrying the AxisHistogram monitor stream, not one of --rxLanes (default none)",
 )
 
 # Get the arguments
@@ -37,7 +93,14 @@ args = parser.parse_args()
 
 #################################################################
 
-with l2si_drp.DrpTDetRoot(pollEn=False, devname=args.dev) as root:
+devices = args.devices.split(',') if args.devices else None
+rxLanes = [int(lane) for lane in args.rxLanes.split(',')] if args.rxLanes else None
+
+with l2si_drp.DrpTDetRoot(pollEn=False, devname=args.dev, devices=devices, pollPeriods=args.poll,
+                          snapshotPeriod=args.snapshot, metricsPort=args.metricsPort, dmaLanes=rxLanes,
+                          memPath=args.memPath, histLane=args.histLane) as root:
+     if root.metrics is not None:
+         print(f'Metrics at {root.metrics.address}')
      pyrogue.pydm.runPyDM(serverList = root.zmqServer.address)
 
 #################################################################
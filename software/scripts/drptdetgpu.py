@@ -29,7 +29,39 @@ parser.add_argument(
     type     = str,
     required = False,
     default  = '/dev/datagpu_0',
-    help     = "path to device",
+    help     = "path to device (sim = behavioral register model)",
+)
+
+parser.add_argument(
+    "--devices",
+    type     = str,
+    required = False,
+    default  = None,
+    help     = "comma separated DevKcu1500 subtrees to build (default all)",
+)
+
+parser.add_argument(
+    "--poll",
+    type     = argBool,
+    required = False,
+    default  = False,
+    help     = "poll status at per device class rates",
+)
+
+parser.add_argument(
+    "--snapshot",
+    type     = float,
+    required = False,
+    default  = 0,
+    help     = "serve clients from a register snapshot read every N seconds (0 = off)",
+)
+
+parser.add_argument(
+    "--metricsPort",
+    type     = int,
+    required = False,
+    default  = None,
+    help     = "serve OpenMetrics card health on this localhost port (0 = any free port)",
 )
 
 # Get the arguments
@@ -37,7 +69,12 @@ args = parser.parse_args()
 
 #################################################################
 
-with l2si_drp.DrpTDetGpuRoot(pollEn=False, devname=args.dev) as root:
+devices = args.devices.split(',') if args.devices else None
+
+with l2si_drp.DrpTDetGpuRoot(pollEn=False, devname=args.dev, devices=devices, pollPeriods=args.poll,
+                             snapshotPeriod=args.snapshot, metricsPort=args.metricsPort) as root:
+     if root.metrics is not None:
+         print(f'Metrics at {root.metrics.address}')
      pyrogue.pydm.runPyDM(serverList = root.zmqServer.address)
 
 #################################################################